@@ -11,13 +11,28 @@ CORS(app)  # Allow React frontend to access backend
 game_state = None
 agent = None
 
+# Latency target for /agent_move: each difficulty level buys this much search
+# time per move, up to a hard ceiling (in seconds). The agent has no iteration
+# cap, so the deadline and early stopping decide how long each move searches.
+SECONDS_PER_DIFFICULTY_LEVEL = float(os.environ.get("SECONDS_PER_DIFFICULTY_LEVEL", 0.25))
+MAX_AGENT_MOVE_SECONDS = float(os.environ.get("MAX_AGENT_MOVE_SECONDS", 5.0))
+
 @app.route("/start_game", methods=["POST"])
 def start_game():
     global game_state, agent
 
     data = request.get_json()
-    iterations = data.get("iterations", 1)
-    agent = Agent(PlayerColor.BLUE, iterations)
+    level = data.get("iterations", 1)
+    workers = int(os.environ.get("MCTS_WORKERS", 1))
+    leaf_rollouts = int(os.environ.get("MCTS_LEAF_ROLLOUTS", 1))
+    threads = int(os.environ.get("MCTS_THREADS", 1))
+    policy_path = os.environ.get("MCTS_POLICY_WEIGHTS")
+    time_limit = min(SECONDS_PER_DIFFICULTY_LEVEL * level, MAX_AGENT_MOVE_SECONDS)
+    agent = Agent(
+        PlayerColor.BLUE, None, time_limit,
+        workers=workers, leaf_rollouts=leaf_rollouts, threads=threads,
+        policy_path=policy_path
+    )
     game_state = agent.game_state
 
     return jsonify({"board": serialize_board(game_state)})
@@ -40,11 +55,11 @@ def human_move():
     
     # Check for overlap before applying move
     for coord in coord_objs:
-        if game_state.get(coord) is not None:
+        if game_state.color_at(coord) is not None:
             return jsonify({"error": "Invalid move: cell already occupied."}), 400
         
     # Adjacency check unless it's the first move
-    red_exists = any(color == PlayerColor.RED for color in game_state.values())
+    red_exists = game_state.bitboards[PlayerColor.RED] != 0
     if red_exists:
         if not any(is_adjacent_to_red(coord, game_state) for coord in coord_objs):
             return jsonify({"error": "Move must be adjacent to an existing red piece."}), 400
@@ -53,8 +68,7 @@ def human_move():
     agent.update(PlayerColor.RED, action)
     game_state = agent.game_state
 
-    current_state = GameState(board=game_state, current_player=PlayerColor.RED)
-    if current_state.has_won(PlayerColor.RED):
+    if game_state.has_won(PlayerColor.RED):
         serialized_board = serialize_board(game_state)
         print("Human has won")
         return jsonify({
@@ -76,8 +90,7 @@ def agent_move():
     agent.update(PlayerColor.BLUE, ai_action)
     game_state = agent.game_state
 
-    current_state = GameState(board=game_state, current_player=PlayerColor.BLUE)
-    if current_state.has_won(PlayerColor.RED):
+    if game_state.has_won(PlayerColor.BLUE):
         serialized_board = serialize_board(game_state)
         print("Agent has won")
         return jsonify({
@@ -90,9 +103,9 @@ def agent_move():
     return jsonify({"board": serialize_board(game_state)})
 
 
-def serialize_board(board_dict):
+def serialize_board(state: GameState):
     grid = [[None for _ in range(11)] for _ in range(11)]
-    for coord, color in board_dict.items():
+    for coord, color in state.board.items():
         if color == PlayerColor.RED:
             grid[coord.r][coord.c] = "R"
         elif color == PlayerColor.BLUE:
@@ -100,11 +113,8 @@ def serialize_board(board_dict):
     return grid
 
 def is_adjacent_to_red(coord: Coord, board):
-    directions = [coord.up(), coord.left(), coord.right(), coord.down()]
-    # for r, c in directions:
-        # neighbor = Coord((coord.r + r) % 11, (coord.c + c) % 11)  # wrap around
-    for neighbor in directions:
-        if board.get(neighbor) == PlayerColor.RED:
+    for neighbor in coord.neighbours:
+        if board.color_at(neighbor) == PlayerColor.RED:
             return True
     return False
 
@@ -4,13 +4,20 @@
 from dataclasses import dataclass
 
 from .pieces import Piece, PieceType, create_piece
-from .coord import Coord, Direction
+from .coord import Coord
 from .player import PlayerColor
 from .actions import Action, PlaceAction
 from .exceptions import IllegalActionException
 from .constants import *
 
 
+# The cells of every piece type placed at the origin, used to probe for legal
+# placements (the board is a torus, so offsets wrap around safely).
+_PIECE_SHAPES = [
+    list(create_piece(piece_type).coords) for piece_type in PieceType
+]
+
+
 @dataclass(frozen=True, slots=True)
 class CellState:
     """
@@ -76,14 +83,21 @@ class Board:
         board state (in practice this is only used for testing).
         """
         self._state: dict[Coord, CellState] = {
-            Coord(r, c): CellState() 
-            for r in range(BOARD_N) 
-            for c in range(BOARD_N)
+            Coord.from_index(i): CellState() 
+            for i in range(BOARD_N * BOARD_N)
         }
         self._state.update(initial_state)
 
+        # Occupancy counters, maintained incrementally by _set_cell_state()
+        self._row_counts: list[int] = [0] * BOARD_N
+        self._col_counts: list[int] = [0] * BOARD_N
+        self._token_counts: list[int] = [0] * NUM_PLAYERS
+        for cell, cell_state in self._state.items():
+            self._count_cell(cell, cell_state, 1)
+
         self._turn_color: PlayerColor = initial_player
         self._history: list[BoardMutation] = []
+        self._game_over: bool | None = None
 
     def __getitem__(self, cell: Coord) -> CellState:
         """
@@ -106,10 +120,11 @@ class Board:
                     f"Unknown action {action}", self._turn_color)
 
         for cell_mutation in mutation.cell_mutations:
-            self._state[cell_mutation.cell] = cell_mutation.next
+            self._set_cell_state(cell_mutation.cell, cell_mutation.next)
         
         self._history.append(mutation)
         self._turn_color = self._turn_color.opponent
+        self._game_over = None
 
         return mutation
 
@@ -124,9 +139,10 @@ class Board:
         mutation: BoardMutation = self._history.pop()
 
         self._turn_color = self._turn_color.opponent
+        self._game_over = None
 
         for cell_mutation in mutation.cell_mutations:
-            self._state[cell_mutation.cell] = cell_mutation.prev
+            self._set_cell_state(cell_mutation.cell, cell_mutation.prev)
 
         return mutation
 
@@ -187,30 +203,42 @@ class Board:
         """
         True iff the game is over.
         """
-        empty_coords = set(filter(self._cell_empty, self._state.keys()))
+        # Cached until the board next changes, since the referee checks this
+        # and then winner_color after every turn.
+        if self._game_over is None:
+            self._game_over = self.turn_limit_reached or \
+                not self.has_legal_move(self._turn_color)
+        return self._game_over
+
+    def has_legal_move(self, color: PlayerColor) -> bool:
+        """
+        True iff the given player can legally place at least one piece. The
+        search stops at the first legal placement found.
+        """
+        # After the first two turns, a piece must touch one of the player's
+        # own tokens, so only empty cells next to those tokens need checking.
+        if self.turn_count >= 2:
+            candidate_coords = {
+                neighbour
+                for coord, cell in self._state.items() if cell.player == color
+                for neighbour in coord.neighbours
+            }
+        else:
+            candidate_coords = self._state.keys()
+
+        for coord in candidate_coords:
+            if self._cell_occupied(coord):
+                continue
+            # Try every piece type with each of its cells anchored on coord.
+            for template in _PIECE_SHAPES:
+                for anchor in template:
+                    if all(
+                        self._cell_empty(coord - anchor + offset)
+                        for offset in template
+                    ):
+                        return True
 
-        if self.turn_limit_reached:
-            return True
-
-        # Try all possible piece types at all empty coordinates to see if there
-        # are any legal moves remaining. This is quite inefficient, but good
-        # enough for the referee's purposes.
-        for piece_type in PieceType: 
-            for coord in empty_coords:
-                try:
-                    piece_coords = set(create_piece(piece_type, coord).coords)
-
-                    self.apply_action(PlaceAction(*piece_coords))
-                    self.undo_action()
-
-                    # If we got here, there's at least one legal move left.
-                    return False
-                
-                except (ValueError, IllegalActionException):
-                    pass
-
-        # Tried all possible moves and none were legal.
-        return True
+        return False
     
     @property
     def winner_color(self) -> PlayerColor | None:
@@ -247,10 +275,19 @@ class Board:
         return self._state[coord].player == None
     
     def _player_token_count(self, color: PlayerColor) -> int:
-        return sum(1 for cell in self._state.values() if cell.player == color)
-    
-    def _occupied_coords(self) -> set[Coord]:
-        return set(filter(self._cell_occupied, self._state.keys()))
+        return self._token_counts[color]
+
+    def _count_cell(self, coord: Coord, cell_state: CellState, delta: int):
+        if cell_state.player is None:
+            return
+        self._row_counts[coord.r] += delta
+        self._col_counts[coord.c] += delta
+        self._token_counts[cell_state.player] += delta
+
+    def _set_cell_state(self, coord: Coord, cell_state: CellState):
+        self._count_cell(coord, self._state[coord], -1)
+        self._count_cell(coord, cell_state, 1)
+        self._state[coord] = cell_state
     
     def _assert_coord_valid(self, coord: Coord):
         if type(coord) != Coord or not self._within_bounds(coord):
@@ -269,8 +306,7 @@ class Board:
                     self._turn_color)
         
     def _has_neighbour(self, coord: Coord, color: PlayerColor) -> bool:
-        for direction in Direction:
-            neighbour = coord + direction
+        for neighbour in coord.neighbours:
             if self._state[neighbour].player == color:
                 return True
         return False
@@ -305,25 +341,23 @@ class Board:
 
     def _resolve_place_action(self, action: PlaceAction) -> BoardMutation:
         piece = self._parse_place_action(action)
-        coords_with_piece = self._occupied_coords() | set(piece.coords)
 
-        min_r = min(c.r for c in piece.coords)
-        max_r = max(c.r for c in piece.coords)
-        min_c = min(c.c for c in piece.coords)
-        max_c = max(c.c for c in piece.coords)
+        # A line is full if its existing tokens plus the piece's cells fill it.
+        piece_rows = [c.r for c in piece.coords]
+        piece_cols = [c.c for c in piece.coords]
         
         remove_r_coords = [
-            Coord(r, c)
-            for r in range(min_r, max_r + 1)
+            Coord.from_index(r * BOARD_N + c)
+            for r in set(piece_rows)
+            if self._row_counts[r] + piece_rows.count(r) == BOARD_N
             for c in range(BOARD_N)
-            if all(Coord(r, c) in coords_with_piece for c in range(BOARD_N))
         ]
 
         remove_c_coords = [
-            Coord(r, c)
+            Coord.from_index(r * BOARD_N + c)
+            for c in set(piece_cols)
+            if self._col_counts[c] + piece_cols.count(c) == BOARD_N
             for r in range(BOARD_N)
-            for c in range(min_c, max_c + 1)
-            if all(Coord(r, c) in coords_with_piece for r in range(BOARD_N))
         ]
 
         cell_mutations = {
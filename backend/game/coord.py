@@ -112,13 +112,65 @@ class Coord(Vector2):
         return f"{self.r}-{self.c}"
 
     def __add__(self, other: 'Direction|Vector2') -> 'Coord':
-        return self.__class__(
-            (self.r + other.r) % BOARD_N, 
-            (self.c + other.c) % BOARD_N,
-        )
+        return _COORDS[
+            (self.r + other.r) % BOARD_N * BOARD_N + (self.c + other.c) % BOARD_N
+        ]
 
     def __sub__(self, other: 'Direction|Vector2') -> 'Coord':
-        return self.__class__(
-            (self.r - other.r) % BOARD_N, 
-            (self.c - other.c) % BOARD_N
-        )
+        return _COORDS[
+            (self.r - other.r) % BOARD_N * BOARD_N + (self.c - other.c) % BOARD_N
+        ]
+
+    def down(self, n: int = 1) -> 'Coord':
+        return _COORDS[(self.r + n) % BOARD_N * BOARD_N + self.c]
+
+    def up(self, n: int = 1) -> 'Coord':
+        return _COORDS[(self.r - n) % BOARD_N * BOARD_N + self.c]
+
+    def left(self, n: int = 1) -> 'Coord':
+        return _COORDS[self.r * BOARD_N + (self.c - n) % BOARD_N]
+
+    def right(self, n: int = 1) -> 'Coord':
+        return _COORDS[self.r * BOARD_N + (self.c + n) % BOARD_N]
+
+    @property
+    def index(self) -> int:
+        """
+        Row-major index of this coordinate, in the range [0, BOARD_N ** 2).
+        """
+        return self.r * BOARD_N + self.c
+
+    @property
+    def neighbours(self) -> tuple['Coord', ...]:
+        """
+        The four adjacent coordinates, in `Direction` order (wrapping at the 
+        edges of the board).
+        """
+        return _NEIGHBOURS[self.r * BOARD_N + self.c]
+
+    @staticmethod
+    def from_index(index: int) -> 'Coord':
+        """
+        Return the canonical coordinate with the given row-major index.
+        """
+        return _COORDS[index]
+
+
+# Canonical (interned) instance of every coordinate on the board, indexed by
+# row-major index. Coordinate arithmetic returns these rather than building new
+# objects, which skips the bounds check in `__post_init__`.
+_COORDS: tuple[Coord, ...] = tuple(
+    Coord(r, c) for r in range(BOARD_N) for c in range(BOARD_N)
+)
+
+# The four neighbours of every coordinate, indexed by row-major index.
+_NEIGHBOURS: tuple[tuple[Coord, ...], ...] = tuple(
+    tuple(
+        _COORDS[
+            (coord.r + d.value.r) % BOARD_N * BOARD_N 
+                + (coord.c + d.value.c) % BOARD_N
+        ]
+        for d in Direction
+    )
+    for coord in _COORDS
+)
@@ -152,40 +152,25 @@ _TEMPLATES = {
 }
 
 
-def piece_fingerprint(
-    coords: Collection[Coord] | Collection[Vector2]
-) -> str | None:
+def _cells_mask(coords: Collection[Coord]) -> int:
     """
-    Compute a unique identifier for a piece, given a set of coords. This
-    identifier is invariant under translation on a toroidal board.
+    Compute a bitmask of the given coords, with bit (r * BOARD_N + c) set for
+    each coord (r, c).
     """
-    min_r = min(coords, key=lambda c: c.r).r
-    min_c = min(coords, key=lambda c: c.c).c
-
-    max_r = max(coords, key=lambda c: c.r).r
-    max_c = max(coords, key=lambda c: c.c).c
-
-    # Shift the piece so that the top-left bounding box coordinate is (0, 0)
-    if min_r == 0 and max_r == BOARD_N - 1:
-        # Piece is wrapped around the top of the board, shift it down
-        coords = [c + Vector2(BOARD_N // 2, 0) for c in coords]
-        min_r = min(coords, key=lambda c: c.r).r
-
-    if min_r != 0:
-        coords = [c - Vector2(min_r, 0) for c in coords]
-
-    if min_c == 0 and max_c == BOARD_N - 1:
-        # Piece is wrapped around the left of the board, shift it right
-        coords = [c + Vector2(0, BOARD_N // 2) for c in coords]
-        min_c = min(coords, key=lambda c: c.c).c
-
-    if min_c != 0:
-        coords = [c - Vector2(0, min_c) for c in coords]
-
-    return ','.join(f"{c.r}{c.c}" for c in sorted(coords))
-
-_PIECE_TYPE_FPS = {
-    piece_fingerprint(v): k for k, v in _TEMPLATES.items()
+    mask = 0
+    for c in coords:
+        mask |= 1 << (c.r * BOARD_N + c.c)
+    return mask
+
+# Every placement of every piece type at every origin on the (toroidal) board,
+# keyed by the bitmask of the cells it covers. This makes piece identification
+# a single dictionary lookup.
+_PIECE_TYPE_MASKS: dict[int, PieceType] = {
+    _cells_mask([
+        Coord.from_index(i) + offset for offset in template
+    ]): piece_type
+    for piece_type, template in _TEMPLATES.items()
+    for i in range(BOARD_N * BOARD_N)
 }
 
 
@@ -206,8 +191,9 @@ class Piece:
         """
         Identify the type of the piece, or return None if no match is found.
         """
-        fp = piece_fingerprint(self.coords)
-        return _PIECE_TYPE_FPS[fp] if fp in _PIECE_TYPE_FPS else None
+        if len(self.coords) != 4:
+            return None
+        return _PIECE_TYPE_MASKS.get(_cells_mask(self.coords))
 
     def __str__(self) -> str:
         return f"Piece({self.coords})"
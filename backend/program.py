@@ -1,141 +1,206 @@
 # COMP30024 Artificial Intelligence, Semester 1 2024
 # Project Part B: Game Playing Agent
 
-from game import PlayerColor, Action, PlaceAction, Coord
+from game import PlayerColor, Action, PlaceAction, Coord, BOARD_N
+from game.pieces import PieceType, create_piece
 
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
 import numpy as np
-import copy
+import heapq
+import math
+import multiprocessing
+import threading
 import time
 
-class Shape:
-    """
-    This is the superclass that represents the basic tetris shape objects
-    """
 
-    def __init__(self, shapes, position=Coord(0, 0), rotation_index=0):
-        self.shapes = shapes
-        self.position = position
-        self.rotation_index = rotation_index
+# Bitboard layout: cell (r, c) is stored at bit r * BOARD_N + c, so the whole
+# board fits in a single 121-bit integer per colour.
+CELL_COUNT = BOARD_N * BOARD_N
+FULL_MASK = (1 << CELL_COUNT) - 1
+ROW_MASKS = tuple(((1 << BOARD_N) - 1) << (r * BOARD_N) for r in range(BOARD_N))
+COL_MASKS = tuple(
+    sum(1 << (r * BOARD_N + c) for r in range(BOARD_N))
+    for c in range(BOARD_N)
+)
+LINE_MASKS = ROW_MASKS + COL_MASKS
+_LAST_ROW_SHIFT = BOARD_N * (BOARD_N - 1)
 
-    def get_place_action(self) -> PlaceAction:
-        """
-        Generates a PlaceAction based on the shape's current position and rotation.
-        
-        Returns:
-            PlaceAction: A PlaceAction object representing the shape's placement
-        """
-        # Get the coordinates for the current rotation
-        relative_coords = self.shapes[self.rotation_index]
-        
-        # Convert relative coordinates to absolute coordinates
-        absolute_coords = [
-            self.position + coord
-            for coord in relative_coords
-        ]
-        
-        # Create and return the PlaceAction
-        return PlaceAction(*absolute_coords)
 
+# Zobrist keys: one random 64-bit key per (colour, cell), plus one for blue to
+# move. Fixed seed, so hashes agree across processes and runs.
+_zobrist_rng = np.random.default_rng(30024)
+ZOBRIST_CELL_KEYS = tuple(
+    tuple(_zobrist_rng.integers(0, 2 ** 63, size=CELL_COUNT).tolist())
+    for _ in PlayerColor
+)
+ZOBRIST_BLUE_TO_MOVE = int(_zobrist_rng.integers(0, 2 ** 63))
 
-class IShape(Shape):
+
+def _symmetry_permutations() -> np.ndarray:
     """
-    I shape and its rotations, with a relative position at (0,0)
+    Builds the cell permutation of every symmetry of the torus that the rules
+    respect: the 8 rotations/reflections of the square (the 19 fixed tetrominoes
+    are closed under them) combined with the 121 translations. Row s maps each
+    cell index to its image under symmetry s; symmetry 0 is the identity.
     """
+    rows, cols = np.divmod(np.arange(CELL_COUNT), BOARD_N)
+    shifts = np.arange(BOARD_N)
+    perms = []
+    for dihedral in range(8):
+        r, c = (cols, rows) if dihedral & 4 else (rows, cols)
+        r = -r if dihedral & 1 else r
+        c = -c if dihedral & 2 else c
+        # Every translation (dr, dc) of this rotation/reflection
+        images = (
+            (r[None, None, :] + shifts[:, None, None]) % BOARD_N * BOARD_N
+            + (c[None, None, :] + shifts[None, :, None]) % BOARD_N
+        )
+        perms.append(images.reshape(-1, CELL_COUNT))
+    return np.concatenate(perms)
 
-    def __init__(self, position=Coord(0, 0), rotation_index=0):
-        shapes = [
-            [Coord(0, 0), Coord(0, 1), Coord(0, 2), Coord(0, 3)],  # horizontal state
-            [Coord(0, 0), Coord(1, 0), Coord(2, 0), Coord(3, 0)]   # vertical state
-        ]
-        super().__init__(shapes, position, rotation_index)
 
+SYMMETRY_PERMUTATIONS = _symmetry_permutations()
+SYMMETRY_COUNT = len(SYMMETRY_PERMUTATIONS)
+
+# SYMMETRY_ZOBRIST[color, cell, s] is the Zobrist key of the image of a token under symmetry s
+SYMMETRY_ZOBRIST = np.array(ZOBRIST_CELL_KEYS, dtype=np.uint64)[:, SYMMETRY_PERMUTATIONS.T]
 
-class OShape(Shape):
+
+def cell_index(coord: Coord) -> int:
     """
-    O shape and its rotations, with a relative position at (0,0)
+    Returns the bit index of a coordinate on the bitboard
     """
-
-    def __init__(self, position=Coord(0, 0), rotation_index=0):
-        shapes = [
-            [Coord(0, 0), Coord(0, 1), Coord(1, 0), Coord(1, 1)]
-        ]
-        super().__init__(shapes, position, rotation_index)
+    return coord.index
 
 
-class TShape(Shape):
+def cell_coord(index: int) -> Coord:
     """
-    T shape and its rotations, with a relative position at (0,0)
+    Returns the coordinate stored at a bit index of the bitboard
     """
-
-    def __init__(self, position=Coord(0, 0), rotation_index=0):
-        shapes = [
-            [Coord(0, 0), Coord(0, 1), Coord(0, 2), Coord(1, 1)],   # Pointing Down
-            [Coord(0, 0), Coord(1, 0), Coord(2, 0), Coord(1, 10)],  # Pointing Left
-            [Coord(0, 0), Coord(0, 10), Coord(0, 9), Coord(10, 10)], # Pointing Up
-            [Coord(0, 0), Coord(10, 0), Coord(9, 0), Coord(10, 1)]   # Pointing Right
-        ]
-        super().__init__(shapes, position, rotation_index)
+    return Coord.from_index(index)
 
 
-class JShape(Shape):
+def coords_to_mask(coords) -> int:
     """
-    J shape and its rotations, with a relative position at (0,0)
+    Converts an iterable of coordinates into a bitboard mask
     """
+    mask = 0
+    for coord in coords:
+        mask |= 1 << cell_index(coord)
+    return mask
 
-    def __init__(self, position=Coord(0, 0), rotation_index=0):
-        shapes = [
-            [Coord(0, 0), Coord(0, 1), Coord(10, 1), Coord(9, 1)], # Pointing Up
-            [Coord(0, 0), Coord(1, 0), Coord(1, 1), Coord(1, 2)],  # Pointing Right
-            [Coord(0, 0), Coord(0, 10), Coord(1, 10), Coord(2, 10)],  # Pointing Down
-            [Coord(0, 0), Coord(10, 0), Coord(10, 10), Coord(10, 9)]   # Pointing Left
-        ]
-        super().__init__(shapes, position, rotation_index)
 
+def iter_bits(mask: int):
+    """
+    Yields the index of every set bit in a bitboard mask, lowest first
+    """
+    while mask:
+        low_bit = mask & -mask
+        yield low_bit.bit_length() - 1
+        mask ^= low_bit
 
-class LShape(Shape):
+
+def neighbour_mask(mask: int) -> int:
     """
-    L shape and its rotations, with a relative position at (0,0)
+    Returns the mask of every cell orthogonally adjacent to a cell in the given
+    mask, wrapping around the edges of the torus
     """
+    up = (mask >> BOARD_N) | ((mask & ROW_MASKS[0]) << _LAST_ROW_SHIFT)
+    down = ((mask << BOARD_N) & FULL_MASK) | (mask >> _LAST_ROW_SHIFT)
+    left = ((mask & ~COL_MASKS[0]) >> 1) | ((mask & COL_MASKS[0]) << (BOARD_N - 1))
+    right = ((mask & ~COL_MASKS[-1]) << 1) | ((mask & COL_MASKS[-1]) >> (BOARD_N - 1))
+    return up | down | left | right
 
-    def __init__(self, position=Coord(0, 0), rotation_index=0):
-        shapes = [
-            [Coord(0, 0), Coord(0, 10), Coord(10, 10), Coord(9, 10)],   # Pointing Up
-            [Coord(0, 0), Coord(10, 0), Coord(10, 1), Coord(10, 2)],    # Pointing Right
-            [Coord(0, 0), Coord(0, 1), Coord(1, 1), Coord(2, 1)],       # Pointing Down
-            [Coord(0, 0), Coord(1, 0), Coord(1, 10), Coord(1, 9)]       # Pointing Left
-        ]
-        super().__init__(shapes, position, rotation_index)
 
 
-class ZShape(Shape):
+@dataclass(frozen=True, slots=True)
+class Placement:
     """
-    Z shape and its rotations, with a relative position at (0,0)
+    A single fixed tetromino placed at a single origin on the torus. Every
+    distinct placement on the board has exactly one entry in PLACEMENTS,
+    indexed by its id.
     """
+    id: int
+    piece_type: PieceType
+    coords: tuple[Coord, ...]
+    cells: tuple[int, ...]
+    mask: int
+    action: PlaceAction
 
-    def __init__(self, position=Coord(0, 0), rotation_index=0):
-        shapes = [
-            [Coord(0, 0), Coord(1, 0), Coord(1, 1), Coord(0, 10)],
-            [Coord(0, 0), Coord(0, 10), Coord(1, 10), Coord(10, 0)]
-        ]
-        super().__init__(shapes, position, rotation_index)
+    def get_place_action(self) -> PlaceAction:
+        """
+        Returns the PlaceAction covering this placement's cells
+        """
+        return self.action
 
 
-class SShape(Shape):
+def _build_placements() -> tuple[Placement, ...]:
     """
-    S shape and its rotations, with a relative position at (0,0)
+    Builds the table of all 19 fixed tetrominoes at all 121 origins
     """
+    placements = []
+    for piece_type in PieceType:
+        for r in range(BOARD_N):
+            for c in range(BOARD_N):
+                coords = tuple(create_piece(piece_type, Coord(r, c)).coords)
+                placements.append(Placement(
+                    id=len(placements),
+                    piece_type=piece_type,
+                    coords=coords,
+                    cells=tuple(cell_index(coord) for coord in coords),
+                    mask=coords_to_mask(coords),
+                    action=PlaceAction(*coords)
+                ))
+    return tuple(placements)
+
+
+PLACEMENTS = _build_placements()
+
+# For every cell, the placements which cover that cell
+PLACEMENTS_BY_CELL = tuple(
+    tuple(p for p in PLACEMENTS if p.mask >> index & 1)
+    for index in range(CELL_COUNT)
+)
+
+# Number of cells each placement puts in each row and column, indexed by placement id
+PLACEMENT_ROW_COUNTS = np.zeros((len(PLACEMENTS), BOARD_N), dtype=np.int32)
+PLACEMENT_COL_COUNTS = np.zeros((len(PLACEMENTS), BOARD_N), dtype=np.int32)
+for _placement in PLACEMENTS:
+    for _coord in _placement.coords:
+        PLACEMENT_ROW_COUNTS[_placement.id, _coord.r] += 1
+        PLACEMENT_COL_COUNTS[_placement.id, _coord.c] += 1
+
+
+def clearance_scores(row_fills: np.ndarray, col_fills: np.ndarray, placement_ids: np.ndarray) -> np.ndarray:
+    """
+    Vectorised clearance heuristic: for every candidate placement, the sum of
+    the fill levels of the rows and columns it touches once it is placed
+
+    Args:
+        row_fills: Number of occupied cells in each row, shape (BOARD_N,)
+        col_fills: Number of occupied cells in each column, shape (BOARD_N,)
+        placement_ids: Ids of the candidate placements, shape (k,)
+
+    Returns:
+        Array of k scores, each normalised by the line length
+    """
+    row_counts = PLACEMENT_ROW_COUNTS[placement_ids]
+    col_counts = PLACEMENT_COL_COUNTS[placement_ids]
+    filled = (
+        ((row_fills + row_counts) * (row_counts > 0)).sum(axis=1)
+        + ((col_fills + col_counts) * (col_counts > 0)).sum(axis=1)
+    )
+    return filled / BOARD_N
 
-    def __init__(self, position=Coord(0, 0), rotation_index=0):
-        shapes = [
-            [Coord(0, 0), Coord(1, 0), Coord(1, 10), Coord(0, 1)],
-            [Coord(0, 0), Coord(1, 0), Coord(0, 10), Coord(10, 10)]
-        ]
-        super().__init__(shapes, position, rotation_index)
 
 class GameState:
     """
     This class is the core environment abstraction that holds the board state
-    and functions
+    and functions. The board is stored as one bitboard per colour, so placing
+    pieces, testing lines and copying states are plain integer operations.
 
     Args:
             board: A dictionary mapping Coord objects to PlayerColor, representing the occupied cells.
@@ -143,207 +208,295 @@ class GameState:
     """
     
     def __init__(self, board: dict[Coord, PlayerColor] = None, current_player : PlayerColor = None, turn_count: int = 0):
-        self.board = board
+        self.bitboards = [0, 0]                     # Indexed by PlayerColor
         self.current_player = current_player
         self.turn_count = turn_count
-    
-    def is_line_full(self, action : PlaceAction) -> tuple[list[int], list[int]]:
+        self.history = []                           # Undo records for apply()
+        self.cells_hash = 0                         # Zobrist hash of the occupied cells
+
+        if board:
+            for coord, color in board.items():
+                self.bitboards[color] |= 1 << cell_index(coord)
+                self.cells_hash ^= ZOBRIST_CELL_KEYS[color][cell_index(coord)]
+
+    @property
+    def zobrist_key(self) -> int:
+        """
+        Zobrist hash of the position: every token on the board plus the side to move
         """
-        This method returns a tuple containing two lists, each 
-        holding the row and columns that are full
+        if self.current_player == PlayerColor.BLUE:
+            return self.cells_hash ^ ZOBRIST_BLUE_TO_MOVE
+        return self.cells_hash
 
-        Args:
-                action: The last move that was made by an agent before updating the board
+    def symmetry_hashes(self) -> np.ndarray:
+        """
+        Zobrist keys of the position's image under every board symmetry, in one
+        vectorised pass. Entry 0 (the identity) equals zobrist_key.
         """
-        rows_to_check = set()
-        cols_to_check = set()
-        for coord in action.coords:
-            rows_to_check.add(coord.r)
-            cols_to_check.add(coord.c)
+        hashes = np.zeros(SYMMETRY_COUNT, dtype=np.uint64)
+        for color in PlayerColor:
+            cells = list(iter_bits(self.bitboards[color]))
+            if cells:
+                hashes ^= np.bitwise_xor.reduce(SYMMETRY_ZOBRIST[color, cells], axis=0)
+        if self.current_player == PlayerColor.BLUE:
+            hashes ^= np.uint64(ZOBRIST_BLUE_TO_MOVE)
+        return hashes
+
+    def canonical_key(self) -> int:
+        """
+        Hash that is identical for every translated, rotated or reflected copy
+        of the position (the smallest of its symmetry hashes)
+        """
+        return int(self.symmetry_hashes().min())
 
-        full_rows = []
-        full_cols = []
-        
-        for target_row in rows_to_check:
-            is_row_full = True
-            for c in range(0,11):
-                if not self.board.get(Coord(target_row, c)):
-                    is_row_full = False
-                    break
-            if is_row_full:
-                full_rows.append(target_row)
-                
-        for target_col in cols_to_check:
-            is_col_full = True
-            for r in range(0,11):
-                if not self.board.get(Coord(r, target_col)):
-                    is_col_full = False
-                    break
-            if is_col_full:
-                full_cols.append(target_col)
-                
-        return full_rows, full_cols
-    
-    def clear_lines(self, rows, cols):
+    def symmetry_representatives(self, placements: list[Placement]) -> list[Placement]:
+        """
+        Collapses placements that lead to symmetric copies of the same position,
+        keeping the first placement of each class. Positions without symmetry
+        (the common case after the opening) are returned unchanged.
+        """
+        hashes = self.symmetry_hashes()
+        if np.count_nonzero(hashes == hashes[0]) == 1:
+            return placements
+
+        seen = set()
+        representatives = []
+        for placement in placements:
+            self.apply(placement)
+            key = self.canonical_key()
+            self.undo()
+            if key not in seen:
+                seen.add(key)
+                representatives.append(placement)
+        return representatives
+
+    def _toggle_hash(self, mask: int, color: PlayerColor):
         """
-        Method responsible for clearing a line that is full
+        Toggles a colour's tokens on the given cells in the Zobrist hash
+        """
+        keys = ZOBRIST_CELL_KEYS[color]
+        for index in iter_bits(mask):
+            self.cells_hash ^= keys[index]
 
-        Args:
-                rows: List of rows that need to be cleared
-                cols: List of columns that need to be cleared
+    @property
+    def occupied(self) -> int:
         """
+        Mask of every occupied cell, regardless of colour
+        """
+        return self.bitboards[0] | self.bitboards[1]
 
-        if rows:
-            for row in rows:
-                for c in range(0,11):
-                    if Coord(row, c) in self.board:
-                        self.board.pop(Coord(row, c), None)
-        
-        if cols:
-            for col in cols:
-                for r in range(0,11):
-                    if Coord(r, col) in self.board:
-                        self.board.pop(Coord(r, col), None)
+    @property
+    def board(self) -> dict[Coord, PlayerColor]:
+        """
+        Dictionary view of the board, mapping occupied Coords to their colour
+        """
+        board = {}
+        for color in PlayerColor:
+            for index in iter_bits(self.bitboards[color]):
+                board[cell_coord(index)] = color
+        return board
 
-    def _clearance_score(self, shape: Shape) -> float:
+    def color_at(self, coord: Coord) -> PlayerColor | None:
         """
-        Heuristic score that rewards moves which bring rows/cols closer to full.
+        Returns the colour occupying a coordinate, or None if it is empty
         """
-        temp_board = copy.deepcopy(self.board)
-        action = shape.get_place_action()
+        bit = 1 << cell_index(coord)
+        for color in PlayerColor:
+            if self.bitboards[color] & bit:
+                return color
+        return None
 
-        for coord in action.coords:
-            temp_board[coord] = self.current_player
+    def copy(self) -> 'GameState':
+        """
+        Returns an independent copy of this state, with an empty undo history
+        """
+        state = GameState(current_player=self.current_player, turn_count=self.turn_count)
+        state.bitboards = self.bitboards[:]
+        state.cells_hash = self.cells_hash
+        return state
 
-        # Count filled cells in affected rows and cols
-        rows = {coord.r for coord in action.coords}
-        cols = {coord.c for coord in action.coords}
+    def place(self, mask: int, color: PlayerColor) -> int:
+        """
+        Places a piece for a player and clears any lines it completes
 
-        score = 0
+        Args:
+                mask: Bitboard mask of the cells covered by the piece
+                color: The colour of the player placing the piece
 
-        for r in rows:
-            filled = sum(1 for c in range(11) if Coord(r, c) in temp_board)
-            score += filled / 11  # Normalize row fill level
+        Returns:
+            Mask of the cells that were cleared
+        """
+        self.bitboards[color] |= mask
+        self._toggle_hash(mask, color)
+        occupied = self.bitboards[0] | self.bitboards[1]
 
-        for c in cols:
-            filled = sum(1 for r in range(11) if Coord(r, c) in temp_board)
-            score += filled / 11  # Normalize col fill level
+        cleared = 0
+        for line in LINE_MASKS:
+            if mask & line and occupied & line == line:
+                cleared |= line
 
-        return score
+        if cleared:
+            self._remove_cells(cleared)
 
-    
-    def _find_valid_coords(self, color: PlayerColor) -> set:
+        return cleared
+
+    def _remove_cells(self, mask: int):
+        """
+        Empties the given cells, whoever occupies them
         """
-        Finds all viable coordinates, after the first move, where a player can potentially lay a piece
+        for color in PlayerColor:
+            self._toggle_hash(self.bitboards[color] & mask, color)
+            self.bitboards[color] &= ~mask
 
-        Args: 
-            color: Player's color
+    def apply(self, placement: Placement):
+        """
+        Plays a placement in place for the current player, clearing any completed
+        lines and passing the turn. The change is recorded so it can be reverted
+        with undo().
 
-        Returns:
-            Set of valid adjacent coords for a token to be placed
+        Args:
+                placement: The placement to play
         """
+        color = self.current_player
+        red, blue = self.bitboards
+        if color == PlayerColor.RED:
+            red |= placement.mask
+        else:
+            blue |= placement.mask
+        cleared = self.place(placement.mask, color)
 
-        # Get all board pieces of the agents color
-        same_colour_pieces = {coord for coord, piece_color in self.board.items() if piece_color == color}
+        # Undo record: what was placed, by whom, and the tokens wiped by line clears
+        self.history.append((placement, color, red & cleared, blue & cleared))
+        self.current_player = color.opponent
+        self.turn_count += 1
 
-        valid_surrounding_spaces = set()
-        for coord in same_colour_pieces:
-            valid_surrounding_spaces = self._find_adjacent_coords(coord, valid_surrounding_spaces)
-        
-        return valid_surrounding_spaces
+    def undo(self) -> Placement:
+        """
+        Reverts the most recent apply(), restoring any cleared lines
+
+        Returns:
+            The placement that was undone
+        """
+        placement, color, cleared_red, cleared_blue = self.history.pop()
+        self.bitboards[0] |= cleared_red
+        self.bitboards[1] |= cleared_blue
+        self.bitboards[color] &= ~placement.mask
+        self._toggle_hash(cleared_red, PlayerColor.RED)
+        self._toggle_hash(cleared_blue, PlayerColor.BLUE)
+        self._toggle_hash(placement.mask, color)
+        self.current_player = color
+        self.turn_count -= 1
+        return placement
     
-    def _find_adjacent_coords(self, coord: Coord, surrounding_spaces : set) -> set:
+    def line_fills(self) -> tuple[np.ndarray, np.ndarray]:
         """
-        Helper method to find valid adjacent coords next to a coord of its own color
+        Returns the number of occupied cells in each row and in each column
+        """
+        occupied = self.occupied
+        row_fills = np.array([(occupied & line).bit_count() for line in ROW_MASKS])
+        col_fills = np.array([(occupied & line).bit_count() for line in COL_MASKS])
+        return row_fills, col_fills
 
-        Args:
-            coord: coordinate to check surroundings of
-            surrounding_spaces: set of coordinates to append valid tokens to
+    def _clearance_score(self, placement: Placement) -> float:
+        """
+        Heuristic score that rewards moves which bring rows/cols closer to full.
+        """
+        mask = placement.mask
+        occupied = self.occupied | mask
 
-        Returns:
-            Updated set of valid surrounding spaces
+        score = 0
+
+        # Count filled cells in affected rows and cols, normalised by line length
+        for line in LINE_MASKS:
+            if mask & line:
+                score += (occupied & line).bit_count() / BOARD_N
+
+        return score
+
+    def frontier_mask(self, color: PlayerColor) -> int:
+        """
+        Returns the mask of empty cells orthogonally adjacent to a player's tokens
         """
+        return neighbour_mask(self.bitboards[color]) & ~self.occupied
 
-        directions = [coord.up(), coord.left(), coord.right(), coord.down()]
-        for direction in directions:
-            if direction not in self.board:
-                surrounding_spaces.add(direction)
-        
-        return surrounding_spaces
-    
-    def _first_turn_valid_coords(self) -> set:
-        valid_coords = set()
-        for r in range(11):
-            for c in  range(11):
-                valid_coords.add(Coord(r,c))
-        
-        return valid_coords
+    def candidate_mask(self, color: PlayerColor) -> int:
+        """
+        Returns the mask of empty cells a player's next placement must cover one
+        of: any empty cell on their first turn (no pieces of their color on the
+        board), otherwise their frontier
+        """
+        if not self.bitboards[color]:
+            return FULL_MASK & ~self.occupied
+        return self.frontier_mask(color)
+
+    def legal_placements(self, color: PlayerColor) -> list[Placement]:
+        """
+        Finds every distinct placement a player can legally make. Each placement
+        appears exactly once, identified by its canonical id, no matter how many
+        frontier coordinates it covers. The list is in no particular order.
+
+        Args:
+            color: The color of the player making the move
+        """
+        occupied = self.occupied
+
+        # Union of the placements covering any valid coordinate
+        candidates = {
+            placement.id: placement
+            for index in iter_bits(self.candidate_mask(color))
+            for placement in PLACEMENTS_BY_CELL[index]
+        }.values()
+
+        # Keep every placement that doesn't overlap existing pieces
+        return [
+            placement for placement in candidates
+            if not placement.mask & occupied
+        ]
 
-    def find_all_valid_moves(self, color: PlayerColor) -> list[tuple[Shape, Coord]]:
+    def clearance_scores(self, placements: list[Placement]) -> np.ndarray:
         """
-        Finds all valid moves for every shape and rotation at each valid coordinate.
-        A move is considered valid
+        Returns the clearance heuristic score of each placement, in one vectorised pass
+        """
+        row_fills, col_fills = self.line_fills()
+        placement_ids = np.fromiter((p.id for p in placements), dtype=np.int64, count=len(placements))
+        return clearance_scores(row_fills, col_fills, placement_ids)
+
+    def find_all_valid_moves(self, color: PlayerColor) -> list[Placement]:
+        """
+        Finds every distinct placement a player can legally make, ordered by the
+        clearance heuristic
 
         Args:
             color: The color of the player making the move
 
         Returns:
-            A list of tuples containing (Shape, Coord) pairs representing valid moves
+            A list of Placements representing valid moves, best heuristic score first
         """
-        valid_moves = []
-        
-        # Check if this is the player's first turn (no pieces of their color on the board)
-        player_pieces = {coord for coord, piece_color in self.board.items() if piece_color == color}
-        if not player_pieces:
-            valid_coords = self._first_turn_valid_coords()
-        else:
-            valid_coords = self._find_valid_coords(color)
-        
-        # Define all possible shapes
-        shapes = [
-            IShape(position=Coord(0, 0)),
-            OShape(position=Coord(0, 0)),
-            TShape(position=Coord(0, 0)),
-            JShape(position=Coord(0, 0)),
-            LShape(position=Coord(0, 0)),
-            ZShape(position=Coord(0, 0)),
-            SShape(position=Coord(0, 0))
-        ]
-        
-        # For each valid coordinate
-        for valid_coord in valid_coords:
-            # For each shape type
-            for shape in shapes:
-                # For each possible rotation
-                for rotation in range(len(shape.shapes)):
-                    # Get the relative coordinates for this rotation
-                    relative_coords = shape.shapes[rotation]
-                    
-                    # For each coordinate in the shape
-                    for rel_coord in relative_coords:
-                        # Calculate the position that would place this coordinate at the valid position
-                        # This is: valid_coord - rel_coord
-                        base_position = valid_coord - rel_coord
-                        
-                        # Create a new shape at the calculated base position
-                        test_shape = type(shape)(position=base_position, rotation_index=rotation)
-                        
-                        # Get the coordinates this shape would occupy
-                        place_action = test_shape.get_place_action()
-                        shape_coords = set(place_action.coords)
-                        
-                        # Check if any coordinates overlap with existing pieces
-                        if not any(coord in self.board for coord in shape_coords):
-                            valid_moves.append((test_shape, valid_coord))
+        valid_moves = self.legal_placements(color)
 
         np.random.shuffle(valid_moves)  # Ensure's fair tie breaking for before applying heuristic
 
-        valid_moves.sort(
-            key=lambda move: self._clearance_score(move[0]),
-            reverse=True
-        )
+        # Score every move in one pass, then stable sort so ties keep the shuffled order
+        order = np.argsort(-self.clearance_scores(valid_moves), kind="stable")
         
-        return valid_moves
+        return [valid_moves[i] for i in order]
+    
+    def has_legal_move(self, color: PlayerColor) -> bool:
+        """
+        Returns True as soon as a single legal placement is found for a player,
+        without generating or ordering the full move list
+
+        Args:
+            color: The color of the player to check
+        """
+        occupied = self.occupied
+
+        for index in iter_bits(self.candidate_mask(color)):
+            for placement in PLACEMENTS_BY_CELL[index]:
+                if not placement.mask & occupied:
+                    return True
+
+        return False
     
     def has_won(self, color : PlayerColor):
         """
@@ -351,72 +504,1045 @@ class GameState:
             True if game is over
             False if moves can be made
         """
-        opponent_color = PlayerColor.BLUE if color == PlayerColor.RED else PlayerColor.RED
-        valid_moves = self.find_all_valid_moves(opponent_color)
-        if not valid_moves: 
-            return True
-        return False
+        return not self.has_legal_move(color.opponent)
     
-class MCTS_Node:
+class RolloutPolicy(ABC):
     """
-    This class is responsible for the structure and implementation
-    of the Monte Carlo Tree Search Algorithm.
+    Superclass for the move samplers used in MCTS playouts. Policies only need
+    to return one legal move per call, so they avoid generating and ordering
+    the full move list that the tree uses.
+    """
+
+    @abstractmethod
+    def choose(self, state: GameState) -> Placement | None:
+        """
+        Returns a legal placement for the player to move, or None if they have none
+        """
+
+
+class RandomRolloutPolicy(RolloutPolicy):
+    """
+    Draws a random legal placement by rejection sampling: pick a random
+    candidate cell, then a random placement covering it, until one fits. Only
+    after `attempts` misses does it fall back to enumerating every legal move,
+    which is also how a player with no moves is detected.
     """
 
-    def __init__(self, state: GameState, parent_node: 'MCTS_Node' = None, previous_action: PlaceAction = None):
-        self.state = state                          # GameState this node represents
-        self.parent_node = parent_node            # Parent Game State
-        self.previous_action = previous_action      # Action taken to get here from parent state
-        self.children: list[MCTS_Node] = []         # List of child nodes
+    def __init__(self, attempts: int = 32):
+        self.attempts = attempts
 
-        self.visits = 0                             
-        self.total_wins = 0
-        self.untried_actions = state.find_all_valid_moves(state.current_player)
+    def choose(self, state: GameState) -> Placement | None:
+        color = state.current_player
+        occupied = state.occupied
+        candidate_cells = state.candidate_mask(color)
 
-    def expand(self) -> 'MCTS_Node':
+        if not candidate_cells:
+            return None
+
+        cells = list(iter_bits(candidate_cells))
+        for _ in range(self.attempts):
+            cell_placements = PLACEMENTS_BY_CELL[cells[np.random.randint(len(cells))]]
+            placement = cell_placements[np.random.randint(len(cell_placements))]
+            if not placement.mask & occupied:
+                return placement
+
+        valid_moves = state.legal_placements(color)
+        if not valid_moves:
+            return None
+        return valid_moves[np.random.randint(len(valid_moves))]
+
+
+class EpsilonGreedyRolloutPolicy(RandomRolloutPolicy):
+    """
+    With probability epsilon plays a random legal placement, otherwise plays
+    the best placement by the clearance heuristic out of `sample_size` random
+    legal placements.
+    """
+
+    def __init__(self, epsilon: float = 0.2, sample_size: int = 8, attempts: int = 32):
+        super().__init__(attempts)
+        self.epsilon = epsilon
+        self.sample_size = sample_size
+
+    def choose(self, state: GameState) -> Placement | None:
+        placement = super().choose(state)
+        if placement is None or np.random.random() < self.epsilon:
+            return placement
+
+        best_placement, best_score = placement, state._clearance_score(placement)
+        for _ in range(self.sample_size - 1):
+            candidate = super().choose(state)
+            score = state._clearance_score(candidate)
+            if score > best_score:
+                best_placement, best_score = candidate, score
+
+        return best_placement
+
+
+ROLLOUT_MAX_DEPTH = 10                              # Plies a playout runs before it is cut off
+
+
+# Cell tables for the batch rollout engine and the static evaluator, which take
+# boards as boolean arrays of CELL_COUNT cells
+PLACEMENT_CELLS = np.array([p.cells for p in PLACEMENTS], dtype=np.intp)
+PLACEMENT_IDS_BY_CELL = np.array([[p.id for p in placements] for placements in PLACEMENTS_BY_CELL], dtype=np.intp)
+CELL_NEIGHBOURS = np.array(
+    [[cell_index(neighbour) for neighbour in cell_coord(index).neighbours] for index in range(CELL_COUNT)],
+    dtype=np.intp
+)
+
+
+def _mask_cells(mask: int) -> np.ndarray:
+    """
+    Converts a bitboard into a boolean array of CELL_COUNT cells
+    """
+    mask_bytes = np.frombuffer(mask.to_bytes((CELL_COUNT + 7) // 8, "little"), dtype=np.uint8)
+    return np.unpackbits(mask_bytes, bitorder="little")[:CELL_COUNT].astype(bool)
+
+
+class StaticEvaluator:
+    """
+    Scores the position where a playout is cut off, as an estimate in [0, 1]
+    of the chance that the player to move wins. Three balances between the
+    player to move and their opponent, each scaled to [-1, 1], are weighted
+    and passed through a logistic function:
+
+    - mobility: legal placements available to each colour
+    - tokens: cells each colour holds on the board
+    - risk: tokens each colour has in nearly full lines, which are about to be cleared
+
+    A player to move with no legal placement has lost, and scores 0.
+    """
+
+    def __init__(
+        self,
+        mobility_weight: float = 2.0,
+        token_weight: float = 1.0,
+        risk_weight: float = 0.5,
+        near_full: int = BOARD_N - 2
+    ):
+        self.mobility_weight = mobility_weight
+        self.token_weight = token_weight
+        self.risk_weight = risk_weight
+        self.near_full = near_full                  # Filled cells for a line to count as nearly full
+
+    def evaluate(self, state: GameState) -> float:
         """
-        Expands the current node by creating a child node for an untried action.
-        
+        Returns the estimated chance that the player to move in the state wins
+        """
+        boards = np.stack([_mask_cells(bitboard) for bitboard in state.bitboards])
+        return float(self.evaluate_batch(boards[None], state.current_player.value)[0])
+
+    def evaluate_batch(self, boards: np.ndarray, color: int) -> np.ndarray:
+        """
+        Scores a batch of positions with the same player to move
+
+        Args:
+            boards: Boolean array of shape (games, 2, CELL_COUNT), indexed by PlayerColor value
+            color: Value of the PlayerColor to move
+
         Returns:
-            MCTS_Node: The newly created child node
+            Array with the estimated chance that the player to move wins each game
         """
-        if not self.untried_actions:
-            return None
-            
-        # Get the next untried action
-        shape, coord = self.untried_actions.pop()
-        action = shape.get_place_action()
-        
-        # Create a new game state for the child
-        new_board = copy.deepcopy(self.state.board)
-        new_state = GameState(
-            board=new_board,
-            current_player=self.state.current_player,
-            turn_count=self.state.turn_count + 1
+        own, opponent = boards[:, color], boards[:, 1 - color]
+        occupied = own | opponent
+
+        # Mobility: code each cell as occupied (bit 0) or a candidate cell for
+        # either colour (bits 1 and 2), then OR the codes over each placement's
+        # cells. A placement is legal for a colour if it covers no occupied
+        # cell and at least one of that colour's candidate cells.
+        def candidates(cells: np.ndarray) -> np.ndarray:
+            frontier = cells[:, CELL_NEIGHBOURS].any(axis=2) & ~occupied
+            return np.where(cells.any(axis=1)[:, None], frontier, ~occupied).astype(np.uint8)
+
+        codes = occupied.astype(np.uint8) | candidates(own) << 1 | candidates(opponent) << 2
+        placement_codes = np.bitwise_or.reduce(codes[:, PLACEMENT_CELLS], axis=2)
+        own_mobility = np.count_nonzero((placement_codes & 0b011) == 0b010, axis=1)
+        opponent_mobility = np.count_nonzero((placement_codes & 0b101) == 0b100, axis=1)
+
+        lines = occupied.reshape(-1, BOARD_N, BOARD_N)
+        at_risk = (
+            (lines.sum(axis=2) >= self.near_full)[:, :, None]
+            | (lines.sum(axis=1) >= self.near_full)[:, None, :]
+        ).reshape(-1, CELL_COUNT)
+
+        score = (
+            self.mobility_weight * _balance(own_mobility, opponent_mobility)
+            + self.token_weight * _balance(own.sum(axis=1), opponent.sum(axis=1))
+            - self.risk_weight * _balance((own & at_risk).sum(axis=1), (opponent & at_risk).sum(axis=1))
         )
+        return np.where(own_mobility > 0, 1 / (1 + np.exp(-score)), 0.0)
+
+
+def _balance(own: np.ndarray, opponent: np.ndarray) -> np.ndarray:
+    """
+    (own - opponent) / (own + opponent), or 0 where both are 0
+    """
+    return (own - opponent) / np.maximum(own + opponent, 1)
+
+
+DEFAULT_EVALUATOR = StaticEvaluator()
+
+
+def simulate_playout(state: GameState, rollout_policy: RolloutPolicy, evaluator: StaticEvaluator = None) -> float:
+    """
+    Plays out a game from the given state with a rollout policy, up to a fixed
+    depth. The playout is applied to the state and undone before returning.
+
+    Returns:
+        float: 1 if the player to move in the given state wins, 0 if they lose,
+        or the evaluator's estimate of their chance of winning if the playout is cut off
+    """
+    original_player = state.current_player
+    
+    # Limit simulation depth to prevent too long simulations
+    max_depth = ROLLOUT_MAX_DEPTH
+    depth = 0
+    result = None
+    
+    while depth < max_depth:
+        placement = rollout_policy.choose(state)
         
-        # Apply the action to the new state
-        for coord in action.coords:
-            new_board[coord] = self.state.current_player
+        if placement is None:
+            # If no valid moves, the current player loses
+            result = float(state.current_player.opponent == original_player)
+            break
             
-        # Switch the current player
-        new_state.current_player = PlayerColor.RED if self.state.current_player == PlayerColor.BLUE else PlayerColor.BLUE
-        
-        # Create the child node
-        child = MCTS_Node(
-            state=new_state,
-            parent_node=self,
-            previous_action=action
-        )
+        # Play the move, clearing any completed lines
+        state.apply(placement)
         
-        # Add the child to the children list
-        self.children.append(child)
+        depth += 1
+
+    # If we reach max depth, score the position statically
+    if result is None:
+        result = (evaluator or DEFAULT_EVALUATOR).evaluate(state)
+        if state.current_player != original_player:
+            result = 1 - result
+
+    # Rewind the playout
+    for _ in range(depth):
+        state.undo()
         
+    return result
+
+
+def batch_playouts(
+    state: GameState,
+    games: int,
+    max_depth: int = ROLLOUT_MAX_DEPTH,
+    attempts: int = 32,
+    evaluator: StaticEvaluator = None
+) -> np.ndarray:
+    """
+    Plays a batch of independent random playouts from a state in lock-step, as
+    boolean arrays of shape (games, 2, CELL_COUNT). Moves are drawn the way
+    RandomRolloutPolicy draws them, by rejection sampling a candidate cell and
+    a placement covering it, for every game at once; only games where every
+    attempt misses fall back to testing all placements, which is also how a
+    player with no moves is detected. Line clears and game ends are computed
+    for the whole batch too. Like simulate_playout, games are cut off after
+    max_depth plies and the positions they reach are scored by the evaluator.
+
+    Args:
+        state: The position to play from. It is not modified
+        games: Number of playouts in the batch
+        max_depth: Plies before a playout is cut off
+        attempts: Rejection sampling rounds before testing every placement
+        evaluator: Scores cut off games (DEFAULT_EVALUATOR if not given)
+
+    Returns:
+        Array with one result per playout for the player to move in the given
+        state: 1 for a win, 0 for a loss, or the evaluator's estimate
+    """
+    boards = np.empty((games, 2, CELL_COUNT), dtype=bool)  # Indexed by game, colour value and cell
+    boards[:, PlayerColor.RED.value] = _mask_cells(state.bitboards[PlayerColor.RED])
+    boards[:, PlayerColor.BLUE.value] = _mask_cells(state.bitboards[PlayerColor.BLUE])
+    results = np.zeros(games)
+    playing = np.arange(games)                      # Games that haven't ended
+    color = state.current_player.value
+
+    for depth in range(max_depth):
+        occupied = boards[playing].any(axis=1)
+        own = boards[playing, color]
+
+        # Candidate cells: any empty cell on a player's first turn, otherwise
+        # the empty cells next to their pieces
+        first_turn = ~own.any(axis=1)
+        frontier = own[:, CELL_NEIGHBOURS].any(axis=2) & ~occupied
+        candidates = np.where(first_turn[:, None], ~occupied, frontier)
+
+        # Rejection sample a placement over a random candidate cell. The
+        # candidate cells of game i are flat_candidates[starts[i]:starts[i] + counts[i]].
+        flat_candidates = np.flatnonzero(candidates) % CELL_COUNT
+        counts = candidates.sum(axis=1)
+        starts = np.cumsum(counts) - counts
+        choices = np.full(len(playing), -1)
+        pending = np.flatnonzero(counts)
+        for _ in range(attempts):
+            if not len(pending):
+                break
+            offsets = (np.random.random(len(pending)) * counts[pending]).astype(np.intp)
+            cells = flat_candidates[starts[pending] + offsets]
+            placement_ids = PLACEMENT_IDS_BY_CELL[cells, np.random.randint(PLACEMENT_IDS_BY_CELL.shape[1], size=len(pending))]
+            fits = ~occupied[pending[:, None], PLACEMENT_CELLS[placement_ids]].any(axis=1)
+            choices[pending[fits]] = placement_ids[fits]
+            pending = pending[~fits]
+
+        # Test every placement for the games where sampling kept missing
+        if len(pending):
+            legal = (
+                ~occupied[pending][:, PLACEMENT_CELLS].any(axis=2)
+                & candidates[pending][:, PLACEMENT_CELLS].any(axis=2)
+            )
+            picks = np.where(legal, np.random.random(legal.shape), -1.0).argmax(axis=1)
+            choices[pending] = np.where(legal.any(axis=1), picks, -1)
+
+        # A player with no legal placement loses. At odd depths that's the
+        # opponent of the player who started.
+        stuck = choices < 0
+        if depth % 2:
+            results[playing[stuck]] = 1.0
+        playing, choices = playing[~stuck], choices[~stuck]
+        if not len(playing):
+            break
+
+        boards[playing[:, None], color, PLACEMENT_CELLS[choices]] = True
+
+        # Clear completed rows and columns
+        occupied = boards[playing].any(axis=1).reshape(-1, BOARD_N, BOARD_N)
+        full_rows = occupied.all(axis=2)
+        full_cols = occupied.all(axis=1)
+        if full_rows.any() or full_cols.any():
+            cleared = (full_rows[:, :, None] | full_cols[:, None, :]).reshape(-1, 1, CELL_COUNT)
+            boards[playing] &= ~cleared
+
+        color ^= 1
+    else:
+        # Score the games that were cut off
+        values = (evaluator or DEFAULT_EVALUATOR).evaluate_batch(boards[playing], color)
+        results[playing] = values if color == state.current_player.value else 1 - values
+
+    return results
+
+
+class BatchRollouts:
+    """
+    Leaf evaluation by the batch rollout engine: every expanded leaf is scored
+    by a batch of playouts run in lock-step in this process. It can stand in
+    for LeafParallelRollouts in run_mcts.
+    """
+
+    def __init__(self, rollouts: int, max_depth: int = ROLLOUT_MAX_DEPTH, evaluator: StaticEvaluator = None):
+        self.rollouts = rollouts                    # Rollouts per expanded leaf
+        self.max_depth = max_depth                  # Plies before a playout is cut off
+        self.evaluator = evaluator                  # Scores cut off playouts
+
+    def run(self, state: GameState, rollout_policy: RolloutPolicy = None) -> float:
+        """
+        Runs the batch of rollouts from the given state. The engine always draws
+        moves like RandomRolloutPolicy, so the rollout policy is not used.
+
+        Returns:
+            The summed results of the rollouts for the player to move in the state
+        """
+        return float(batch_playouts(state, self.rollouts, self.max_depth, evaluator=self.evaluator).sum())
+
+
+DEFAULT_ROLLOUT_POLICY = RandomRolloutPolicy()
+
+
+POLICY_FEATURE_COUNT = 7
+
+
+def placement_features(state: GameState, placement_ids: np.ndarray) -> np.ndarray:
+    """
+    Features of candidate placements for the player to move, one row per
+    placement, computed for all of them at once:
+
+    - the clearance heuristic score
+    - rows and columns the placement completes
+    - own and opponent tokens in those lines, which the placement clears
+    - own and opponent tokens next to the placement's cells
+    - opponent candidate cells the placement takes away
+
+    Returns:
+        Array of shape (len(placement_ids), POLICY_FEATURE_COUNT)
+    """
+    color = state.current_player
+    own = _mask_cells(state.bitboards[color])
+    opponent = _mask_cells(state.bitboards[color.opponent])
+    row_fills, col_fills = state.line_fills()
+    row_counts = PLACEMENT_ROW_COUNTS[placement_ids]
+    col_counts = PLACEMENT_COL_COUNTS[placement_ids]
+    cells = PLACEMENT_CELLS[placement_ids]
+
+    completed_rows = row_fills + row_counts == BOARD_N
+    completed_cols = col_fills + col_counts == BOARD_N
+    own_lines, opponent_lines = own.reshape(BOARD_N, BOARD_N), opponent.reshape(BOARD_N, BOARD_N)
+
+    def cleared(lines: np.ndarray) -> np.ndarray:
+        return completed_rows @ lines.sum(axis=1) + completed_cols @ lines.sum(axis=0)
+
+    opponent_frontier = opponent[CELL_NEIGHBOURS].any(axis=1) & ~(own | opponent)
+
+    return np.stack([
+        clearance_scores(row_fills, col_fills, placement_ids),
+        completed_rows.sum(axis=1) + completed_cols.sum(axis=1),
+        cleared(own_lines) / BOARD_N,
+        cleared(opponent_lines) / BOARD_N,
+        own[CELL_NEIGHBOURS].sum(axis=1)[cells].sum(axis=1) / 4,
+        opponent[CELL_NEIGHBOURS].sum(axis=1)[cells].sum(axis=1) / 4,
+        opponent_frontier[cells].sum(axis=1) / 4,
+    ], axis=1).astype(np.float32)
+
+
+class PolicyPrior:
+    """
+    A small NumPy policy network over placement features: a linear model with
+    a single layer, or an MLP with ReLU between layers. The logits of all
+    the candidate placements of a position are computed in one batched pass
+    and turned into PUCT priors with a softmax.
+
+    Weights are stored in a .npz file as W0, b0, W1, b1, ... where W0 has
+    POLICY_FEATURE_COUNT rows and the last layer has one output.
+    """
+
+    def __init__(self, layers: list[tuple[np.ndarray, np.ndarray]]):
+        if layers[0][0].shape[0] != POLICY_FEATURE_COUNT or layers[-1][0].shape[1] != 1:
+            raise ValueError(
+                f"Policy layers must map {POLICY_FEATURE_COUNT} features to 1 output"
+            )
+        self.layers = [(np.asarray(W, dtype=np.float32), np.asarray(b, dtype=np.float32)) for W, b in layers]
+
+    @classmethod
+    def load(cls, path: str) -> 'PolicyPrior':
+        """
+        Loads the policy weights from a .npz file
+        """
+        with np.load(path) as weights:
+            return cls([(weights[f"W{i}"], weights[f"b{i}"]) for i in range(len(weights.files) // 2)])
+
+    def save(self, path: str):
+        """
+        Saves the policy weights to a .npz file
+        """
+        arrays = {}
+        for i, (W, b) in enumerate(self.layers):
+            arrays[f"W{i}"], arrays[f"b{i}"] = W, b
+        np.savez(path, **arrays)
+
+    def priors(self, state: GameState, placement_ids: np.ndarray) -> np.ndarray:
+        """
+        Returns the prior probability of each candidate placement for the player to move
+        """
+        if not len(placement_ids):
+            return np.zeros(0, dtype=np.float32)
+
+        activations = placement_features(state, placement_ids)
+        for i, (W, b) in enumerate(self.layers):
+            activations = activations @ W + b
+            if i < len(self.layers) - 1:
+                activations = np.maximum(activations, 0)
+
+        logits = activations[:, 0]
+        exp = np.exp(logits - logits.max())
+        return exp / exp.sum()
+
+
+class TranspositionTable:
+    """
+    Bounded map from a position's Zobrist key to the node pool slot holding its
+    statistics. When the table is full, the least recently used entry is
+    evicted; nodes that already point at the evicted slot keep it, they just
+    stop being shared. A canonical table keys positions by
+    GameState.canonical_key, so symmetric copies of a position share stats as well.
+    """
+
+    def __init__(self, capacity: int = 1 << 16, canonical: bool = False):
+        self.capacity = capacity
+        self.canonical = canonical
+        self._entries: OrderedDict[int, int] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def key(self, state: GameState) -> int:
+        """
+        Returns the key this table uses for a state
+        """
+        return state.canonical_key() if self.canonical else state.zobrist_key
+
+    def lookup(self, key: int, index: int) -> int:
+        """
+        Returns the pool slot holding the stats for a position, registering the
+        given slot if the position is new
+        """
+        with self._lock:
+            stats_index = self._entries.get(key)
+            if stats_index is not None:
+                self._entries.move_to_end(key)
+                return stats_index
+
+            self._entries[key] = index
+            if len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+            return index
+
+    def clear(self):
+        """
+        Forgets every entry, for when the pool the slots refer to is replaced
+        """
+        with self._lock:
+            self._entries.clear()
+
+
+# Game-theoretic values proven by the solver, from the perspective of the
+# player who moved into a node (like its wins). 0 means undecided.
+PROVEN_WIN = 1
+PROVEN_LOSS = -1
+
+
+class NodePool:
+    """
+    Struct-of-arrays storage for an MCTS tree: node i is described by entry i
+    of every column. The children of a node sit in one contiguous block of
+    slots, allocated best-first by the clearance heuristic when the node's
+    moves are generated; the first expanded_count of them have been expanded,
+    the others only record their move. Nodes don't store a GameState, a node's
+    position is the root's with the action ids on its path replayed.
+
+    A node's visits and wins are read through stats_index, which is its own
+    slot or, with a transposition table, the slot of the first node that
+    reached the same position. Every write happens under the pool's lock.
+
+    The pool also works as an MCTS-Solver: a child whose player to move has
+    no legal placement is a proven win for the player who moved into it, and
+    proofs propagate up the tree. A node is a proven loss for the player who
+    moved into it if any child is a proven win, and a proven win if every
+    child is a proven loss. Decided children are skipped by selection and
+    proven losses don't count towards the widening limit.
+    """
+
+    widening_constant = 2.0
+    widening_exponent = 0.5
+    puct_constant = 1.5
+
+    _COLUMNS = (
+        ("parent", np.int32),                       # Parent slot, -1 for the root
+        ("action", np.int16),                       # Placement id played from the parent, -1 for the root
+        ("player", np.int8),                        # Value of the PlayerColor to move
+        ("first_child", np.int32),                  # First slot of the child block, -1 until generated
+        ("child_count", np.int16),                  # Legal moves in the child block
+        ("expanded_count", np.int16),               # Children expanded so far
+        ("stats_index", np.int32),                  # Slot holding this node's visits and wins
+        ("key", np.uint64),                         # Transposition key, set once expanded
+        ("visits", np.int32),
+        ("wins", np.float64),                       # Summed results for the player who moved into the node
+        ("prior", np.float32),                      # Policy prior of the move into the node
+        ("proven", np.int8),                        # PROVEN_WIN, PROVEN_LOSS or 0, read through stats_index
+        ("virtual_losses", np.int32),               # In-flight visits from other search threads
+    )
+
+    def __init__(
+        self,
+        transpositions: TranspositionTable = None,
+        policy: PolicyPrior = None,
+        capacity: int = 1024
+    ):
+        self.size = 0
+        for name, dtype in self._COLUMNS:
+            setattr(self, name, np.empty(capacity, dtype=dtype))
+
+        # Table entries are slots of one pool, so a table moving to a new pool starts empty
+        self.transpositions = transpositions
+        if transpositions is not None:
+            transpositions.clear()
+        self.policy = policy                        # Priors for PUCT selection, or None for UCB1
+        self.collapse_symmetries: set[int] = set()  # Nodes keeping one move per symmetry class
+        self.lock = threading.RLock()
+
+    def _allocate(self, count: int) -> int:
+        """
+        Reserves `count` consecutive slots, growing the columns if needed, and
+        returns the first one
+        """
+        start = self.size
+        end = start + count
+        capacity = len(self.parent)
+        if end > capacity:
+            capacity = max(end, 2 * capacity)
+            for name, _ in self._COLUMNS:
+                column = getattr(self, name)
+                grown = np.empty(capacity, dtype=column.dtype)
+                grown[:start] = column[:start]
+                setattr(self, name, grown)
+        self.size = end
+        return start
+
+    def _init_slots(self, start: int, end: int, parent: int, player: PlayerColor):
+        """
+        Initialises slots start to end as unexpanded nodes with no statistics
+        """
+        self.parent[start:end] = parent
+        self.player[start:end] = player.value
+        self.first_child[start:end] = -1
+        self.child_count[start:end] = 0
+        self.expanded_count[start:end] = 0
+        self.stats_index[start:end] = np.arange(start, end)
+        self.key[start:end] = 0
+        self.visits[start:end] = 0
+        self.wins[start:end] = 0
+        self.prior[start:end] = 0
+        self.proven[start:end] = 0
+        self.virtual_losses[start:end] = 0
+
+    def _register(self, index: int, state: GameState):
+        """
+        Points a node at the shared statistics for its position, if there is a table
+        """
+        if self.transpositions is not None:
+            key = self.transpositions.key(state)
+            self.key[index] = key
+            self.stats_index[index] = self.transpositions.lookup(key, index)
+
+    def add_root(self, state: GameState) -> int:
+        """
+        Adds a node with no parent for the given state, returning its slot
+        """
+        with self.lock:
+            index = self._allocate(1)
+            self._init_slots(index, index + 1, -1, state.current_player)
+            self.action[index] = -1
+            self._register(index, state)
+        return index
+
+    def generate_moves(self, index: int, state: GameState):
+        """
+        Allocates a node's child block, holding its legal moves best-first by
+        the policy prior if there is a policy, or else the clearance heuristic
+
+        Args:
+            index: The node's slot
+            state: The search state, positioned at the node
+        """
+        moves = state.legal_placements(state.current_player)
+        if index in self.collapse_symmetries:
+            moves = state.symmetry_representatives(moves)
+        action_ids = np.fromiter((p.id for p in moves), dtype=np.int16, count=len(moves))
+        if self.policy is not None:
+            priors = self.policy.priors(state, action_ids)
+            scores = priors
+        else:
+            priors = np.zeros(len(moves), dtype=np.float32)
+            scores = state.clearance_scores(moves)
+        tie_breaks = np.random.random(len(moves))   # Ensure's fair tie breaking between equal scores
+        order = np.lexsort((tie_breaks, -scores))
+        action_ids, priors = action_ids[order], priors[order]
+
+        with self.lock:
+            if self.first_child[index] >= 0:        # Another thread got here first
+                return
+            start = self._allocate(len(action_ids))
+            self._init_slots(start, self.size, index, state.current_player.opponent)
+            self.action[start:self.size] = action_ids
+            self.prior[start:self.size] = priors
+            self.first_child[index] = start
+            self.child_count[index] = len(action_ids)
+
+    def can_expand(self, index: int, state: GameState) -> bool:
+        """
+        Returns True if a node may grow another child at its current visit
+        count (progressive widening), generating its moves if needed
+        """
+        if self.proven[self.stats_index[index]]:
+            return False
+        if self.first_child[index] < 0:
+            self.generate_moves(index, state)
+
+        expanded = int(self.expanded_count[index])
+        if expanded >= self.child_count[index]:
+            return False
+
+        # Children proven lost don't take up the widening limit
+        first = int(self.first_child[index])
+        lost = np.count_nonzero(self.proven[self.stats_index[first:first + expanded]] == PROVEN_LOSS)
+        visits = int(self.visits[self.stats_index[index]])
+        limit = 1 + int(self.widening_constant * visits ** self.widening_exponent)
+        return expanded - lost < limit
+
+    def expand(self, index: int, state: GameState) -> int:
+        """
+        Expands the next best move of a node, applying it to the given state,
+        which is left at the child
+
+        Returns:
+            The child's slot, or -1 if the node can't expand
+        """
+        with self.lock:
+            if not self.can_expand(index, state):
+                return -1
+            child = int(self.first_child[index] + self.expanded_count[index])
+            self.expanded_count[index] += 1
+            state.apply(PLACEMENTS[self.action[child]])
+            self._register(child, state)
+
+            # A player to move with no legal placement has lost
+            stats = self.stats_index[child]
+            if not self.proven[stats] and not state.has_legal_move(state.current_player):
+                self.proven[stats] = PROVEN_WIN
+            if self.proven[stats]:
+                self._propagate_proof(index)
         return child
 
+    def _propagate_proof(self, index: int):
+        """
+        Proves a node from its children's proofs, and its ancestors in turn,
+        stopping at the first node that stays undecided
+        """
+        while index >= 0:
+            stats = self.stats_index[index]
+            if self.proven[stats] or self.first_child[index] < 0:
+                return
+
+            first = int(self.first_child[index])
+            child_proofs = self.proven[self.stats_index[first:first + int(self.child_count[index])]]
+            if (child_proofs == PROVEN_WIN).any():
+                self.proven[stats] = PROVEN_LOSS
+            elif len(child_proofs) and (child_proofs == PROVEN_LOSS).all():
+                self.proven[stats] = PROVEN_WIN
+            else:
+                return
+
+            index = self.parent[index]
+
+    def children(self, index: int) -> range:
+        """
+        Slots of a node's expanded children
+        """
+        first = int(self.first_child[index])
+        if first < 0:
+            return range(0)
+        return range(first, first + int(self.expanded_count[index]))
+
+    def child_for(self, index: int, mask: int) -> int:
+        """
+        Returns the slot of the expanded child reached by the placement covering
+        the given cells, or -1
+        """
+        for child in self.children(index):
+            if PLACEMENTS[self.action[child]].mask == mask:
+                return child
+        return -1
+
+    def select_child(self, index: int, exploration_constant: float = 1.41) -> int:
+        """
+        Selects the best expanded child of a node, evaluated for the whole
+        child block in one vectorised pass: PUCT with the policy priors if the
+        pool has a policy, or else UCB1
+
+        Returns:
+            The selected child's slot, or -1 if there are none
+        """
+        children = self.children(index)
+        if not children:
+            return -1
+
+        # Visits still in flight in other threads count as losses, steering
+        # concurrent searches apart
+        block = slice(children.start, children.stop)
+        stats = self.stats_index[block]
+        visits = self.visits[stats] + self.virtual_losses[block]
+        parent_stats = self.stats_index[index]
+        parent_visits = max(int(self.visits[parent_stats] + self.virtual_losses[index]), 1)
+        safe_visits = np.maximum(visits, 1)
+
+        if self.policy is not None:
+            # PUCT formula: value + prior-weighted exploration. Unvisited
+            # children take the parent's value from the mover's side.
+            parent_value = 1 - self.wins[parent_stats] / self.visits[parent_stats] if self.visits[parent_stats] else 0.5
+            values = np.where(visits > 0, self.wins[stats] / safe_visits, parent_value)
+            ucb_values = values + self.puct_constant * self.prior[block] * math.sqrt(parent_visits) / (1 + visits)
+        else:
+            # UCB1 formula: exploitation + exploration. Unvisited children get
+            # the maximum value, so they are always tried first.
+            ucb_values = self.wins[stats] / safe_visits + exploration_constant * np.sqrt(math.log(parent_visits) / safe_visits)
+            ucb_values[visits == 0] = np.inf
+
+        # Always play a proven win and never a proven loss
+        proofs = self.proven[stats]
+        ucb_values[proofs == PROVEN_LOSS] = -np.inf
+        ucb_values[proofs == PROVEN_WIN] = np.inf
+
+        # Return the child with the highest value
+        return children.start + int(np.argmax(ucb_values))
+
+    def add_virtual_loss(self, index: int, amount: int):
+        with self.lock:
+            self.virtual_losses[index] += amount
+
+    def remove_virtual_loss(self, index: int, amount: int):
+        """
+        Removes virtual loss from a node and all its ancestors, for an iteration
+        that was abandoned before its result could be backpropagated
+        """
+        with self.lock:
+            while index >= 0:
+                self.virtual_losses[index] -= amount
+                index = self.parent[index]
+
+    def backpropagate(
+        self,
+        index: int,
+        result: float,
+        original_player: PlayerColor,
+        simulations: int = 1,
+        virtual_loss: int = 0
+    ):
+        """
+        Updates the statistics of a node and all its ancestors, walking up the
+        parent column. Each node's wins count the wins of the player who moved into it.
+
+        Args:
+            index: The slot the simulation ran from
+            result: Summed results of the simulations for the original player, each 1 for a win, 0 for a loss or a static estimate
+            original_player: The player who started the simulation
+            simulations: Number of simulations the result aggregates
+            virtual_loss: Virtual loss added on the way down, to be removed again
+        """
+        original = original_player.value
+        with self.lock:
+            while index >= 0:
+                self.virtual_losses[index] -= virtual_loss
+                stats = self.stats_index[index]
+                self.visits[stats] += simulations
+
+                # Reward is from the perspective of the player who moved into this node
+                if self.player[index] != original:
+                    self.wins[stats] += result
+                else:
+                    self.wins[stats] += simulations - result
+
+                index = self.parent[index]
+
+    def path(self, index: int) -> list[int]:
+        """
+        Returns the placement ids played from the root to reach a node
+        """
+        actions = []
+        while self.parent[index] >= 0:
+            actions.append(int(self.action[index]))
+            index = self.parent[index]
+        return actions[::-1]
+
+    def state_at(self, index: int, root_state: GameState) -> GameState:
+        """
+        Rebuilds a node's state by replaying its path on a copy of the root's state
+        """
+        state = root_state.copy()
+        for placement_id in self.path(index):
+            state.apply(PLACEMENTS[placement_id])
+        return state
+
+    def _copy_slots(self, source: 'NodePool', source_start: int, start: int, count: int, parent: int):
+        """
+        Copies a block of slots from another pool, resolving shared statistics
+        into each slot and leaving the copies without children
+        """
+        source_slots = slice(source_start, source_start + count)
+        slots = slice(start, start + count)
+        for name, _ in self._COLUMNS:
+            getattr(self, name)[slots] = getattr(source, name)[source_slots]
+
+        stats = source.stats_index[source_slots]
+        self.visits[slots] = source.visits[stats]
+        self.wins[slots] = source.wins[stats]
+        self.proven[slots] = source.proven[stats]
+        self.stats_index[slots] = np.arange(start, start + count)
+        self.parent[slots] = parent
+        self.first_child[slots] = -1
+
+    def extract_subtree(self, index: int) -> 'NodePool':
+        """
+        Returns a new pool holding a copy of the subtree under a node, rooted at
+        slot 0. The transposition table is rebuilt for the new pool, so nodes
+        outside the subtree are no longer referenced and can be freed.
+        """
+        with self.lock:
+            pool = NodePool(self.transpositions, self.policy)
+            pool._allocate(1)
+            pool._copy_slots(self, index, 0, 1, -1)
+            pool.action[0] = -1
+            pending = [(index, 0)]
+            while pending:
+                source_index, new_index = pending.pop()
+                if pool.transpositions is not None:
+                    pool.stats_index[new_index] = pool.transpositions.lookup(int(pool.key[new_index]), new_index)
+
+                source_first = int(self.first_child[source_index])
+                if source_first < 0:
+                    continue
+                count = int(self.child_count[source_index])
+                first = pool._allocate(count)
+                pool.first_child[new_index] = first
+                pool._copy_slots(self, source_first, first, count, new_index)
+                for offset in range(int(self.expanded_count[source_index])):
+                    pending.append((source_first + offset, first + offset))
+
+        return pool
+
+
+class MCTS_Node:
+    """
+    This class is responsible for the structure and implementation
+    of the Monte Carlo Tree Search Algorithm. A node is a light handle on one
+    slot of a NodePool, which holds the whole tree in arrays; handles are made
+    on demand and compare equal when they refer to the same slot. Nodes don't
+    hold a GameState of their own: the search walks a single mutable state with
+    apply()/undo(), so a node's state is whatever the search has applied on
+    the way down.
+
+    Moves are generated lazily, the first time a node is considered for
+    expansion, and expanded best-first as the node's visit count grows
+    (progressive widening): a node may have at most
+    1 + widening_constant * visits ** widening_exponent children.
+    """
+
+    __slots__ = ("pool", "index")
+
+    def __init__(
+        self,
+        state: GameState,
+        transpositions: TranspositionTable = None,
+        collapse_symmetries: bool = False,
+        policy: PolicyPrior = None
+    ):
+        self.pool = NodePool(transpositions, policy)
+        self.index = self.pool.add_root(state)
+        self.collapse_symmetries = collapse_symmetries
+
+    @classmethod
+    def _at(cls, pool: NodePool, index: int) -> 'MCTS_Node':
+        """
+        Returns a handle on a slot of a pool, or None for slot -1
+        """
+        if index < 0:
+            return None
+        node = cls.__new__(cls)
+        node.pool = pool
+        node.index = int(index)
+        return node
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, MCTS_Node) and self.pool is other.pool and self.index == other.index
+
+    def __hash__(self) -> int:
+        return hash((id(self.pool), self.index))
+
+    @property
+    def current_player(self) -> PlayerColor:
+        return PlayerColor(int(self.pool.player[self.index]))
+
+    @property
+    def parent_node(self) -> 'MCTS_Node | None':
+        return MCTS_Node._at(self.pool, self.pool.parent[self.index])
+
+    @property
+    def placement(self) -> Placement | None:
+        action = self.pool.action[self.index]
+        return PLACEMENTS[action] if action >= 0 else None
+
+    @property
+    def previous_action(self) -> PlaceAction | None:
+        placement = self.placement
+        return placement.get_place_action() if placement else None
+
+    @property
+    def children(self) -> list['MCTS_Node']:
+        return [MCTS_Node._at(self.pool, child) for child in self.pool.children(self.index)]
+
+    @property
+    def visits(self) -> int:
+        return int(self.pool.visits[self.pool.stats_index[self.index]])
+
+    @property
+    def total_wins(self) -> float:
+        return float(self.pool.wins[self.pool.stats_index[self.index]])
+
+    @property
+    def virtual_losses(self) -> int:
+        return int(self.pool.virtual_losses[self.index])
+
+    @property
+    def proven(self) -> int:
+        """
+        PROVEN_WIN or PROVEN_LOSS for the player who moved into this node, or 0 if undecided
+        """
+        return int(self.pool.proven[self.pool.stats_index[self.index]])
+
+    @property
+    def transpositions(self) -> TranspositionTable | None:
+        return self.pool.transpositions
+
+    @property
+    def collapse_symmetries(self) -> bool:
+        """
+        Whether this node keeps one move per symmetry class
+        """
+        return self.index in self.pool.collapse_symmetries
+
+    @collapse_symmetries.setter
+    def collapse_symmetries(self, collapse: bool):
+        if collapse:
+            self.pool.collapse_symmetries.add(self.index)
+        else:
+            self.pool.collapse_symmetries.discard(self.index)
+
+    @property
+    def lock(self) -> threading.RLock:
+        return self.pool.lock
+
+    def can_expand(self, state: GameState) -> bool:
+        """
+        Returns True if this node may grow another child at its current visit count
+
+        Args:
+            state: The search state, positioned at this node
+        """
+        return self.pool.can_expand(self.index, state)
+
+    def expand(self, state: GameState) -> 'MCTS_Node':
+        """
+        Expands the current node by creating a child node for its next best
+        action. The action is applied to the given state, which is left at the child.
+
+        Args:
+            state: The search state, positioned at this node
+        
+        Returns:
+            MCTS_Node: The newly created child node
+        """
+        return MCTS_Node._at(self.pool, self.pool.expand(self.index, state))
+
+    @property
+    def fully_expanded(self) -> bool:
+        """
+        True once every legal move of this node has been expanded into a child
+        """
+        pool = self.pool
+        return pool.first_child[self.index] >= 0 and pool.expanded_count[self.index] == pool.child_count[self.index]
+
+    def child_for(self, mask: int) -> 'MCTS_Node | None':
+        """
+        Returns the child reached by the placement covering the given cells, or
+        None if that placement hasn't been expanded
+        """
+        return MCTS_Node._at(self.pool, self.pool.child_for(self.index, mask))
+
     def select_child(self, exploration_constant: float = 1.41) -> 'MCTS_Node':
         """
-        Selects the best child node using the UCB1 formula.
+        Selects the best child node using PUCT with the tree's policy priors,
+        or the UCB1 formula if the tree has no policy.
         
         Args:
             exploration_constant: The exploration parameter (default is sqrt(2))
@@ -424,84 +1550,553 @@ class MCTS_Node:
         Returns:
             MCTS_Node: The selected child node
         """
-        if not self.children:
-            return None
-            
-        # Calculate UCB1 value for each child
-        ucb_values = []
-        for child in self.children:
-            if child.visits == 0:
-                # If child hasn't been visited, give it maximum value
-                ucb_values.append(float('inf'))
-            else:
-                # UCB1 formula: exploitation + exploration
-                exploitation = child.total_wins / child.visits
-                exploration = exploration_constant * np.sqrt(np.log(self.visits) / child.visits)
-                ucb_values.append(exploitation + exploration)
-        
-        # Return the child with the highest UCB1 value
-        return self.children[np.argmax(ucb_values)]
+        return MCTS_Node._at(self.pool, self.pool.select_child(self.index, exploration_constant))
+
+    def add_virtual_loss(self, amount: int):
+        """
+        Marks visits in flight through this node, counted as losses until backpropagated
+        """
+        self.pool.add_virtual_loss(self.index, amount)
+
+    def remove_virtual_loss(self, amount: int):
+        """
+        Removes the virtual loss added along the path from the root to this node
+        """
+        self.pool.remove_virtual_loss(self.index, amount)
 
-    def simulate(self) -> bool:
+    def simulate(self, state: GameState, rollout_policy: RolloutPolicy = None) -> float:
         """
-        Simulates a random playout from the current state until reaching a terminal state.
+        Simulates a playout from the current state until reaching a terminal state.
+        The playout is applied to the given state and undone before returning.
+
+        Args:
+            state: The search state, positioned at this node
+            rollout_policy: Chooses each playout move (uniformly random by default)
         
         Returns:
-            bool: True if the original player (from this node) wins, False otherwise
+            float: The result for the original player (from this node): 1 for a win,
+            0 for a loss, or a static estimate if the playout was cut off
         """
-        current_state = copy.deepcopy(self.state)
-        original_player = current_state.current_player
-        
-        # Limit simulation depth to prevent too long simulations
-        max_depth = 10
-        depth = 0
-        
-        while depth < max_depth:
-            # Get all valid moves for the current player
-            valid_moves = current_state.find_all_valid_moves(current_state.current_player)
-            
-            if not valid_moves:
-                # If no valid moves, the current player loses
-                winner = PlayerColor.RED if current_state.current_player == PlayerColor.BLUE else PlayerColor.BLUE
-                return winner == original_player
-                
-            # Randomly select a move
-            move_index = np.random.randint(0, len(valid_moves))
-            shape, coord = valid_moves[move_index]
-            action = shape.get_place_action()
-            
-            # Apply the move
-            for coord in action.coords:
-                current_state.board[coord] = current_state.current_player
-            
-            # Check for and clear any completed lines
-            full_rows, full_cols = current_state.is_line_full(action)
-            current_state.clear_lines(full_rows, full_cols)
-                
-            # Switch players
-            current_state.current_player = PlayerColor.RED if current_state.current_player == PlayerColor.BLUE else PlayerColor.BLUE
-            
-            depth += 1
-            
-        # If we reach max depth, consider it a draw
-        return False
+        # Decided positions score exactly, without a playout
+        if self.proven:
+            return float(self.proven == PROVEN_LOSS)
+        return simulate_playout(state, rollout_policy or DEFAULT_ROLLOUT_POLICY)
 
-    def backpropagate(self, result: bool, original_player: PlayerColor):
+    def backpropagate(self, result: float, original_player: PlayerColor, simulations: int = 1, virtual_loss: int = 0):
         """
         Updates the statistics of this node and all its ancestors based on the simulation result.
+        Each node's total_wins counts the wins of the player who moved into it.
 
         Args:
-            result: True if the original player won, False otherwise
+            result: Summed results of the simulations for the original player, each 1 for a win, 0 for a loss or a static estimate
             original_player: The player who started the simulation
+            simulations: Number of simulations the result aggregates
+            virtual_loss: Virtual loss added on the way down, to be removed again
+        """
+        self.pool.backpropagate(self.index, result, original_player, simulations, virtual_loss)
+
+    def detach(self) -> 'MCTS_Node':
+        """
+        Returns this node as the root of a new tree holding only its subtree
+        """
+        return MCTS_Node._at(self.pool.extract_subtree(self.index), 0)
+
+
+class SearchBudget:
+    """
+    Wall-clock deadline and/or iteration cap for an anytime search. The search
+    can be stopped at any point and still return its best move so far; it also
+    stops early once the most visited root child can no longer be overtaken
+    with the iterations the budget has left.
+
+    Args:
+        time_limit: Seconds from now until the deadline, or None for no deadline
+        iterations: Maximum number of iterations, or None for no cap
+    """
+
+    check_interval = 16                             # Iterations between early stopping checks
+
+    def __init__(self, time_limit: float = None, iterations: int = None):
+        self.start_time = time.monotonic()
+        self.deadline = self.start_time + time_limit if time_limit is not None else None
+        self.iterations = iterations
+
+    def remaining_time(self) -> float | None:
+        """
+        Seconds left until the deadline, or None if there is no deadline
+        """
+        if self.deadline is None:
+            return None
+        return max(self.deadline - time.monotonic(), 0.0)
+
+    def exhausted(self, done: int) -> bool:
+        """
+        True once the deadline has passed or the iteration cap has been reached
         """
-        self.visits += 1
+        if self.iterations is not None and done >= self.iterations:
+            return True
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    def remaining_iterations(self, done: int) -> float:
+        """
+        Estimate of the iterations left, projecting the time left at the rate so far
+        """
+        remaining = float('inf')
+        if self.iterations is not None:
+            remaining = self.iterations - done
+        if self.deadline is not None:
+            now = time.monotonic()
+            elapsed = now - self.start_time
+            if elapsed > 0 and done:                # No rate to project from before the first iteration
+                remaining = min(remaining, done / elapsed * max(self.deadline - now, 0.0))
+        return remaining
+
+    def should_stop(self, root: 'MCTS_Node', done: int, visits_per_iteration: int = 1) -> bool:
+        """
+        True if the search from root should stop after `done` iterations, either
+        because the budget is spent or because the choice of move is settled
+        """
+        if self.exhausted(done):
+            return True
+
+        # The solver has proven the root: a winning move is known, or every move loses
+        if root.proven:
+            return True
+        if done % self.check_interval:
+            return False
+
+        # Only one legal move: nothing to decide
+        if len(root.children) == 1 and root.fully_expanded:
+            return True
+
+        # Moves not expanded yet count as having no visits
+        top_visits = heapq.nlargest(2, (child.visits for child in root.children)) + [0, 0]
+        if not top_visits[0]:
+            return False
+        return top_visits[0] - top_visits[1] > self.remaining_iterations(done) * visits_per_iteration
+
+
+def run_mcts(
+    root: MCTS_Node,
+    state: GameState,
+    budget: SearchBudget,
+    rollout_policy: RolloutPolicy = None,
+    leaf_rollouts: 'LeafParallelRollouts' = None
+) -> int:
+    """
+    Runs MCTS iterations from a root node until the search budget says to stop
+
+    Args:
+        root: The root of the search tree
+        state: The search state, positioned at the root. It is restored before returning
+        budget: Deadline and/or iteration cap for the search
+        rollout_policy: Chooses each playout move
+        leaf_rollouts: If given, runs a batch of rollouts per expanded leaf on a worker pool
+
+    Returns:
+        The number of iterations that were run
+    """
+    history_length = len(state.history)
+    simulations = leaf_rollouts.rollouts if leaf_rollouts is not None else 1
+    
+    count = 0
+    while not budget.should_stop(root, count, simulations):
+        # Selection, stopping at decided nodes
+        node = root
+        while node.children and not node.proven and not node.can_expand(state):
+            node = node.select_child()
+            state.apply(node.placement)
+        
+        # Expansion
+        if node.can_expand(state):
+            node = node.expand(state)
+        
+        # Simulation
+        if leaf_rollouts is not None and not node.proven:
+            result = leaf_rollouts.run(state, rollout_policy)
+        else:
+            result = node.simulate(state, rollout_policy) * simulations
+        
+        # Backpropagation
+        node.backpropagate(result, node.current_player, simulations)
+
+        # Rewind the search state back to the root
+        while len(state.history) > history_length:
+            state.undo()
+        
+        count += 1
+
+    return count
+
+
+def root_child_stats(root: MCTS_Node) -> dict[int, tuple[int, float, int]]:
+    """
+    Returns the (visits, total_wins, proven) of each child of a root node, keyed by placement id
+    """
+    return {
+        child.placement.id: (child.visits, child.total_wins, child.proven)
+        for child in root.children
+    }
+
+
+def best_root_move(child_stats: dict[int, tuple[int, float, int]]) -> int:
+    """
+    Returns the placement id to play from the root children's stats: a proven
+    win if there is one, else the most visited move not proven to lose
+    """
+    for placement_id, (_, _, proven) in child_stats.items():
+        if proven == PROVEN_WIN:
+            return placement_id
+
+    candidates = [placement_id for placement_id, stats in child_stats.items() if stats[2] != PROVEN_LOSS]
+    return max(candidates or child_stats, key=lambda placement_id: child_stats[placement_id][0])
+
+
+def tree_parallel_search(
+    root: MCTS_Node,
+    state: GameState,
+    threads: int,
+    budget: SearchBudget,
+    rollout_policy: RolloutPolicy = None,
+    virtual_loss: int = 1
+) -> int:
+    """
+    Tree parallelism: several threads run MCTS iterations on the same tree. Each
+    thread walks its own copy of the search state, expansion and statistics
+    updates are guarded by the node pool's lock, and every node on a thread's path
+    carries a virtual loss until its result is backpropagated, so that other
+    threads prefer different lines. Scales with cores on free-threaded builds.
+    If a thread raises, the others stop and the error is re-raised once they have.
+
+    Returns:
+        The number of iterations that were run
+    """
+    counter_lock = threading.Lock()
+    count = 0
+    failed = False                                  # Set by a thread that raised, to stop the others
+
+    def claim_iteration() -> bool:
+        nonlocal count
+        with counter_lock:
+            if failed or budget.should_stop(root, count):
+                return False
+            count += 1
+            return True
+
+    def worker():
+        nonlocal failed
+        local_state = state.copy()
+        while claim_iteration():
+            # Selection and expansion, adding virtual loss along the path
+            node = root
+            root.add_virtual_loss(virtual_loss)
+            backpropagated = False
+            try:
+                while not node.proven:
+                    with root.lock:
+                        if node.can_expand(local_state):
+                            node = node.expand(local_state)
+                            node.add_virtual_loss(virtual_loss)
+                            break
+                        child = node.select_child()
+                        if child is None:
+                            break
+                        child.add_virtual_loss(virtual_loss)
+                    node = child
+                    local_state.apply(node.placement)
+
+                # Simulation
+                result = node.simulate(local_state, rollout_policy)
+
+                # Backpropagation, removing the virtual loss
+                node.backpropagate(result, node.current_player, 1, virtual_loss)
+                backpropagated = True
+            finally:
+                # Don't leave virtual loss in the tree if the iteration failed
+                if not backpropagated:
+                    failed = True
+                    node.remove_virtual_loss(virtual_loss)
+
+            # Rewind the search state back to the root
+            while local_state.history:
+                local_state.undo()
+
+    # Leaving the executor waits for every thread, and result() re-raises their errors
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        futures = [executor.submit(worker) for _ in range(threads)]
+    for future in futures:
+        future.result()
+
+    return count
+
+
+def _root_search_worker(
+    state: GameState,
+    iterations: int | None,
+    time_limit: float | None,
+    rollout_policy: RolloutPolicy,
+    collapse_symmetries: bool,
+    seed: int,
+    policy: PolicyPrior = None
+) -> dict[int, tuple[int, float, int]]:
+    """
+    Runs one independent search in a worker process, with its own RNG seed
+    """
+    np.random.seed(seed)
+    root = MCTS_Node(state, collapse_symmetries=collapse_symmetries, policy=policy)
+    run_mcts(root, state, SearchBudget(time_limit, iterations), rollout_policy)
+    return root_child_stats(root)
+
+
+_process_pools: dict[int, ProcessPoolExecutor] = {}
+_process_pools_lock = threading.Lock()
+
+
+def _get_process_pool(workers: int) -> ProcessPoolExecutor:
+    """
+    Returns a process pool with the given number of workers, shared by every
+    agent in this process so that worker start-up is only paid once. Workers
+    are started by a fork server, since the pool may be created from a thread
+    of a multi-threaded server, where forking directly can deadlock.
+    """
+    with _process_pools_lock:
+        if workers not in _process_pools:
+            _process_pools[workers] = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context("forkserver")
+            )
+        return _process_pools[workers]
+
 
-        # Reward is from the original player's perspective
-        if self.state.current_player != original_player:
-            self.total_wins += 1 if result else 0
+def _rollout_batch_worker(state: GameState, rollout_policy: RolloutPolicy, rollouts: int, seed: int) -> float:
+    """
+    Runs a batch of rollouts in a worker process, returning their summed results for the player to move
+    """
+    np.random.seed(seed)
+    return sum(simulate_playout(state, rollout_policy) for _ in range(rollouts))
+
+
+class LeafParallelRollouts:
+    """
+    Leaf parallelism: every expanded leaf is evaluated by a batch of rollouts
+    split across a pool of worker processes, so the tree itself stays in the
+    main process and gets one backpropagation per batch.
+    """
 
-        if self.parent_node is not None:
-            self.parent_node.backpropagate(result, original_player)
+    def __init__(self, workers: int, rollouts: int):
+        self.workers = workers                      # Processes sharing the batch
+        self.rollouts = rollouts                    # Rollouts per expanded leaf
+
+    def run(self, state: GameState, rollout_policy: RolloutPolicy = None) -> float:
+        """
+        Runs the batch of rollouts from the given state
+
+        Returns:
+            The summed results of the rollouts for the player to move in the state
+        """
+        rollout_policy = rollout_policy or DEFAULT_ROLLOUT_POLICY
+        leaf = state.copy()                         # Leaves the undo history behind
+        batch_sizes = [
+            len(chunk) for chunk in np.array_split(np.arange(self.rollouts), self.workers) if len(chunk)
+        ]
+        seeds = np.random.SeedSequence().generate_state(len(batch_sizes))
+
+        pool = _get_process_pool(self.workers)
+        futures = [
+            pool.submit(_rollout_batch_worker, leaf, rollout_policy, batch_size, int(seed))
+            for batch_size, seed in zip(batch_sizes, seeds)
+        ]
+        return sum(future.result() for future in futures)
+
+
+def root_parallel_search(
+    state: GameState,
+    workers: int,
+    budget: SearchBudget,
+    rollout_policy: RolloutPolicy = None,
+    collapse_symmetries: bool = False,
+    policy: PolicyPrior = None
+) -> dict[int, tuple[int, float, int]]:
+    """
+    Root-parallel MCTS: runs one independent search per worker process from the
+    same position, each with a distinct RNG seed, and merges the visit and win
+    counts of the root children
+
+    Returns:
+        The merged (visits, total_wins, proven) of each root child, keyed by
+        placement id. A move proven by any worker counts as proven.
+    """
+    seeds = np.random.SeedSequence().generate_state(workers)
+    pool = _get_process_pool(workers)
+    futures = [
+        pool.submit(
+            _root_search_worker, state, budget.iterations, budget.remaining_time(),
+            rollout_policy, collapse_symmetries, int(seed), policy
+        )
+        for seed in seeds
+    ]
+
+    merged: dict[int, tuple[int, float, int]] = {}
+    for future in futures:
+        for placement_id, (visits, wins, proven) in future.result().items():
+            merged_visits, merged_wins, merged_proven = merged.get(placement_id, (0, 0, 0))
+            merged[placement_id] = (merged_visits + visits, merged_wins + wins, merged_proven or proven)
+
+    return merged
+
+
+class _SolverTimeout(Exception):
+    """
+    Raised inside the endgame solver when its deadline passes
+    """
+
+
+class EndgameSolver:
+    """
+    Exact alpha-beta search for the endgame, used instead of MCTS once the
+    player to move has at most `move_threshold` legal placements or the board
+    has at most `cell_threshold` empty cells. Positions are only ever won or
+    lost (a player with no legal placement loses), so the negamax values are
+    1, -1, or 0 for positions not decided within the search depth. The search
+    deepens iteratively until the root is decided or the time runs out.
+
+    Moves are ordered with the best move cached for the position first, then
+    by the clearance heuristic. Results are cached by Zobrist key with the
+    depth searched and the kind of bound they are; wins and losses hold at
+    any depth. The cache is kept between moves and cleared when it fills.
+    """
+
+    EXACT, LOWER, UPPER = 0, 1, 2
+
+    def __init__(
+        self,
+        move_threshold: int = 20,
+        cell_threshold: int = 24,
+        time_limit: float = 1.0,
+        capacity: int = 1 << 18
+    ):
+        self.move_threshold = move_threshold
+        self.cell_threshold = cell_threshold
+        self.time_limit = time_limit                # Seconds per solve if the caller gives none
+        self.capacity = capacity
+        self.cache: dict[int, tuple[int, int, int, int]] = {}  # Key: (depth, value, bound, best placement id)
+        self._deadline = None
+        self._nodes = 0
+
+    def applies(self, state: GameState) -> bool:
+        """
+        True if the state is far enough into the endgame for the solver
+        """
+        empty_cells = CELL_COUNT - state.occupied.bit_count()
+        if empty_cells <= self.cell_threshold:
+            return True
+        return len(state.legal_placements(state.current_player)) <= self.move_threshold
+
+    def solve(self, state: GameState, time_limit: float = None) -> Placement | None:
+        """
+        Searches the state for a winning placement for the player to move
+
+        Args:
+            state: The position to solve. It is restored before returning
+            time_limit: Seconds allowed, or None for the solver's default
+
+        Returns:
+            A placement that wins by force, or None if the position is lost or
+            wasn't decided in time
+        """
+        self._deadline = time.monotonic() + (self.time_limit if time_limit is None else time_limit)
+        self._nodes = 0
+        history_length = len(state.history)
+
+        try:
+            depth = 1
+            while True:
+                value = self._search(state, depth, -1, 1)
+                if value:
+                    break
+                depth += 1
+        except _SolverTimeout:
+            while len(state.history) > history_length:
+                state.undo()
+            return None
+
+        if value < 0:
+            return None
+        return PLACEMENTS[self.cache[state.zobrist_key][3]]
+
+    def _order(self, state: GameState, moves: list[Placement], best_id: int) -> list[Placement]:
+        """
+        Orders moves for the search: the cached best move, then by clearance score
+        """
+        order = np.argsort(-state.clearance_scores(moves), kind="stable")
+        ordered = [moves[i] for i in order]
+        if best_id >= 0:
+            ordered.sort(key=lambda placement: placement.id != best_id)
+        return ordered
+
+    def _store(self, key: int, depth: int, value: int, bound: int, best_id: int):
+        if len(self.cache) >= self.capacity:
+            self.cache.clear()
+        self.cache[key] = (depth, value, bound, best_id)
+
+    def _search(self, state: GameState, depth: int, alpha: int, beta: int) -> int:
+        """
+        Negamax alpha-beta search
+
+        Returns:
+            1 if the player to move wins, -1 if they lose, 0 if undecided within depth
+        """
+        self._nodes += 1
+        if not self._nodes % 256 and time.monotonic() > self._deadline:
+            raise _SolverTimeout()
+
+        key = state.zobrist_key
+        best_id = -1
+        entry = self.cache.get(key)
+        if entry is not None:
+            cached_depth, value, bound, best_id = entry
+            # Wins and losses are proven whatever depth they were found at
+            if value == 1 and bound != self.UPPER or value == -1 and bound != self.LOWER:
+                return value
+            if cached_depth >= depth:
+                if bound == self.EXACT:
+                    return value
+                if bound == self.LOWER:
+                    alpha = max(alpha, value)
+                else:
+                    beta = min(beta, value)
+                if alpha >= beta:
+                    return value
+
+        # At the search horizon only a player without moves is decided
+        if depth == 0:
+            return 0 if state.has_legal_move(state.current_player) else -1
+
+        moves = state.legal_placements(state.current_player)
+        if not moves:
+            self._store(key, depth, -1, self.EXACT, -1)
+            return -1
+
+        original_alpha = alpha
+        best_value = -2
+        for placement in self._order(state, moves, best_id):
+            state.apply(placement)
+            value = -self._search(state, depth - 1, -beta, -alpha)
+            state.undo()
+
+            if value > best_value:
+                best_value, best_id = value, placement.id
+            alpha = max(alpha, value)
+            if alpha >= beta:
+                break
+
+        if best_value <= original_alpha:
+            bound = self.UPPER
+        elif best_value >= beta:
+            bound = self.LOWER
+        else:
+            bound = self.EXACT
+        self._store(key, depth, best_value, bound, best_id)
+        return best_value
 
 
 class Agent:
@@ -510,16 +2105,58 @@ class Agent:
     respond to various Tetress game events.
     """
 
-    def __init__(self, color: PlayerColor, iterations: int, **referee: dict):
+    def __init__(
+        self,
+        color: PlayerColor,
+        iterations: int | None,
+        time_limit: float | None = 170,
+        rollout_policy: RolloutPolicy = None,
+        workers: int = 1,
+        leaf_rollouts: int = 1,
+        threads: int = 1,
+        transposition_capacity: int = 1 << 16,
+        use_symmetries: bool = True,
+        policy_path: str = None,
+        endgame_threshold: int = 20,
+        **referee: dict
+    ):
         """
         This constructor method runs when the referee instantiates the agent.
         Any setup and/or precomputation should be done here.
+
+        Each move is searched until `iterations` root visits or `time_limit`
+        seconds, whichever comes first, stopping earlier once the move is settled.
+        With iterations None, only the deadline and early stopping end the search.
+        With threads > 1 the agent searches one shared tree from several threads.
+        Otherwise, with workers > 1 it searches root-parallel, unless leaf_rollouts > 1,
+        in which case the workers share each leaf's batch of rollouts instead.
+        With a single worker, leaf_rollouts > 1 runs each leaf's batch of rollouts
+        in lock-step with the vectorised batch engine.
+        A transposition_capacity of 0 disables the transposition table.
+        With use_symmetries, root moves leading to symmetric positions are searched
+        once, and the transposition table keys positions up to symmetry.
+        With policy_path, a PolicyPrior is loaded from that .npz file and the
+        tree selects children by PUCT instead of UCB1.
+        Once the agent has at most endgame_threshold legal placements, an exact
+        EndgameSolver looks for a forced win first; 0 disables it.
         """
 
-        self.game_state: dict[Coord, PlayerColor] = {}  # board represented by a dictionary
+        self.game_state = GameState(current_player=color)  # board represented by bitboards
         self.turn_count = 0
 
-        self.iterations = iterations
+        self.iterations = iterations                # Root visits per move, None for no cap
+        self.time_limit = time_limit                # Seconds per move, None for no deadline
+        self.rollout_policy = rollout_policy or DEFAULT_ROLLOUT_POLICY
+        self.workers = workers                      # Processes searching in parallel
+        self.leaf_rollouts = leaf_rollouts          # Rollouts per expanded leaf
+        self.threads = threads                      # Threads sharing one search tree
+        self._root: MCTS_Node | None = None         # Search tree kept between turns
+        self.use_symmetries = use_symmetries
+        self.policy = PolicyPrior.load(policy_path) if policy_path else None
+        self.endgame = EndgameSolver(endgame_threshold) if endgame_threshold > 0 else None
+        self.transpositions = None
+        if transposition_capacity > 0:
+            self.transpositions = TranspositionTable(transposition_capacity, canonical=use_symmetries)
 
         self._color = color
         match color:
@@ -533,57 +2170,64 @@ class Agent:
         This method is called by the referee each time it is the agent's turn
         to take an action. It must always return an action object.
         """
-        # Create a GameState object from our current state
-        current_state = GameState(
-            board=self.game_state,
-            current_player=self._color,
-            turn_count=self.turn_count
-        )
-        
-        # Create root node for MCTS
-        root = MCTS_Node(current_state)
-        
-        # Time limit for MCTS (in seconds)
-        time_limit = 170  # Leave 10 seconds buffer
-        start_time = time.time()
+        # The deadline counts from the moment the move is requested
+        deadline_budget = SearchBudget(self.time_limit)
+
+        # Create the search state from our current state
+        state = self.game_state.copy()
+        state.current_player = self._color
+        state.turn_count = self.turn_count
+
+        # Exact search in the endgame, using at most half the time for the move.
+        # MCTS takes over if it finds no forced win in time.
+        if self.endgame is not None and self.endgame.applies(state):
+            remaining = deadline_budget.remaining_time()
+            time_limit = self.endgame.time_limit if remaining is None else min(self.endgame.time_limit, remaining / 2)
+            placement = self.endgame.solve(state, time_limit)
+            if placement is not None:
+                return placement.get_place_action()
         
-        # Run MCTS iterations until time limit
-        iterations = 0
-        while time.time() - start_time < time_limit:
-            # Selection
-            node = root
-            while node.untried_actions == [] and node.children != []:
-                node = node.select_child()
-            
-            # Expansion
-            if node.untried_actions:
-                node = node.expand()
-            
-            # Simulation
-            result = node.simulate()
-            
-            # Backpropagation
-            node.backpropagate(result, self._color)
-            
-            iterations += 1
-            
-            # Early exit if we've done enough iterations
-            if iterations >= self.iterations:
-                break
+        if self.workers > 1 and self.leaf_rollouts <= 1 and self.threads <= 1:
+            # Root parallelism: independent searches whose root statistics are merged
+            budget = SearchBudget(deadline_budget.remaining_time(), self.iterations)
+            child_stats = root_parallel_search(
+                state, self.workers, budget, self.rollout_policy, self.use_symmetries, self.policy
+            )
+        else:
+            # Reuse the subtree kept from the previous turn if there is one, and
+            # only search for the iterations it doesn't already have
+            if self._root is None or self._root.current_player != self._color:
+                self._root = MCTS_Node(state, transpositions=self.transpositions, policy=self.policy)
+            root = self._root
+            root.collapse_symmetries = self.use_symmetries
+            iterations = None if self.iterations is None else max(self.iterations - root.visits, 1)
+            budget = SearchBudget(deadline_budget.remaining_time(), iterations)
+
+            if self.threads > 1:
+                # Tree parallelism: several threads sharing one tree
+                tree_parallel_search(root, state, self.threads, budget, self.rollout_policy)
+            else:
+                # Single tree, optionally with a batch of rollouts per leaf
+                leaf_rollouts = None
+                if self.leaf_rollouts > 1 and self.workers > 1:
+                    leaf_rollouts = LeafParallelRollouts(self.workers, self.leaf_rollouts)
+                elif self.leaf_rollouts > 1:
+                    leaf_rollouts = BatchRollouts(self.leaf_rollouts)
+
+                run_mcts(root, state, budget, self.rollout_policy, leaf_rollouts)
+            child_stats = root_child_stats(root)
         
-        # Select the best child of the root node
-        if root.children:
-            # Select the child with the most visits
-            best_child = max(root.children, key=lambda child: child.visits)
-            return best_child.previous_action
+        # Select a proven win, or else the child of the root node with the most visits
+        if child_stats:
+            return PLACEMENTS[best_root_move(child_stats)].get_place_action()
         else:
             # If no children were created (shouldn't happen if there are valid moves),
             # select a random valid move
-            valid_moves = current_state.find_all_valid_moves(self._color)
+            valid_moves = state.find_all_valid_moves(self._color)
             if valid_moves:
                 move_index = np.random.randint(0, len(valid_moves))
-                shape, coord = valid_moves[move_index]
-                return shape.get_place_action()
+                placement = valid_moves[move_index]
+                return placement.get_place_action()
             else:
                 # This should never happen as the referee should handle game over
                 raise Exception("No valid moves available")
@@ -595,29 +2239,16 @@ class Agent:
         """
         # There is only one action type, PlaceAction
         place_action: PlaceAction = action
-        c1, c2, c3, c4 = place_action.coords
-
-        # Update the board with the new piece
-        self.game_state[c1] = color
-        self.game_state[c2] = color
-        self.game_state[c3] = color
-        self.game_state[c4] = color
-
-        # Create a temporary GameState to check for and clear lines
-        temp_state = GameState(
-            board=self.game_state,
-            current_player=color,
-            turn_count=self.turn_count
-        )
+        mask = coords_to_mask(place_action.coords)
 
-        # Check for and clear any completed lines
-        full_rows, full_cols = temp_state.is_line_full(place_action)
-        temp_state.clear_lines(full_rows, full_cols)
+        # Update the board with the new piece, clearing any completed lines
+        self.game_state.place(mask, color)
+        self.game_state.current_player = color.opponent
 
-        # Update our game state with the cleared lines
-        self.game_state = temp_state.board
+        # Re-root the kept search tree at the child for this action, if it was expanded
+        if self._root is not None:
+            child = self._root.child_for(mask)
+            self._root = child.detach() if child is not None else None
 
         self.turn_count += 1
 
-        # print(f"{color} played PLACE action: {c1}, {c2}, {c3}, {c4}")
-
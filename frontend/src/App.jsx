@@ -61,14 +61,14 @@ function App() {
     <div style={{ textAlign: "center", color: "white", background: "#111", minHeight: "100vh" }}>
       <h1>Tetromino: Human vs Agent</h1>
       <div>
-        <label>Iterations (1-20): </label>
+        <label>Difficulty (1-20): </label>
         <select value={iterations} onChange={(e) => setIterations(Number(e.target.value))}>
           {Array.from({ length: 20 }, (_, i) => i + 1).map(val => (
             <option key={val} value={val}>{val}</option>
           ))}
         </select>
         <p style={{ fontSize: "0.9rem", color: "#ccc", marginTop: 4 }}>
-          More iterations = smarter AI but slower performance. (Select once before start of game)
+          Higher difficulty = more thinking time per move, so a smarter AI but slower replies. (Select once before start of game)
         </p>
       </div>
       <button onClick={handleStart}>Start Game</button>